@@ -1,59 +1,226 @@
 import hashlib
+import numpy as np
+import struct
+from Codec import encode_element, iter_elements, pack_elements
 from py_ecc.optimized_bn128 import curve_order
 from typing import Any, List
 
 
 class MHT:
+    HASH_SIZE = 32
+    EMPTY_LEAF = bytes(HASH_SIZE)
+    REINDEX_RATIO = 8
+
     def __init__(self, items: List[Any]):
-        self.items = items
-        self.hashes = [self.get_hash(e) for e in items]
-        self.hash_2_e = {hash: e for hash, e in zip(self.hashes, self.items)}
-        self.hash_2_idx = {}
-        self.layers = []
+        leaves = bytearray()
+        for e in items:
+            leaves += self.get_hash(e)
+
+        self.layers = [leaves]
+        self.index_keys = np.zeros(0, dtype=np.uint64)
+        self.index_pos = np.zeros(0, dtype=np.uint32)
+        self.pending = {}
         self.merkle_root = self.build_tree()
 
     @staticmethod
     def get_hash(e):
-        if isinstance(e, tuple):
-            e_str = str(tuple(sorted(e))).encode('utf-8')
-        else:
-            e_str = str(e).encode('utf-8')
+        return hashlib.sha256(encode_element(e)).digest()
 
-        return hashlib.sha256(e_str).digest()
+    def __len__(self):
+        return len(self.layers[0]) // self.HASH_SIZE
 
-    def build_tree(self):
-        for idx, hash in enumerate(self.hashes):
-            self.hash_2_idx[hash] = idx
+    def node(self, level: int, idx: int):
+        return bytes(self.layers[level][idx * self.HASH_SIZE:(idx + 1) * self.HASH_SIZE])
+
+    def leaf(self, idx: int):
+        return self.node(0, idx)
+
+    def iter_leaves(self):
+        for idx in range(len(self)):
+            yield self.node(0, idx)
+
+    # ------------------------------------------------------------
+
+    def reindex(self):
+        keys = np.frombuffer(self.layers[0], dtype='>u8').reshape(-1, 4)[:, 0].astype(np.uint64)
+        order = np.argsort(keys, kind='stable')
+
+        self.index_keys = keys[order]
+        self.index_pos = order.astype(np.uint32)
+        self.pending = {}
+
+    def index_of(self, hash):
+        idx = self.pending.get(hash)
+        if idx is not None:
+            return idx if self.leaf(idx) == hash else None
+
+        key = np.uint64(int.from_bytes(hash[:8], 'big'))
+        pos = int(np.searchsorted(self.index_keys, key))
 
-        cur_layer = self.hashes
-        self.layers.append(cur_layer)
+        while pos < len(self.index_keys) and self.index_keys[pos] == key:
+            idx = int(self.index_pos[pos])
+            if self.leaf(idx) == hash:
+                return idx
+            pos += 1
 
-        while len(cur_layer) > 1:
-            next_layer = []
-            for i in range(0, len(cur_layer), 2):
-                l_hash = cur_layer[i]
-                r_hash = cur_layer[i + 1] if (i + 1 < len(cur_layer)) else l_hash
-                parent_hash = hashlib.sha256(l_hash + r_hash).digest()
-                next_layer.append(parent_hash)
+        return None
 
-            cur_layer = next_layer
+    @staticmethod
+    def hash_layer(cur_layer):
+        pair_size = 2 * MHT.HASH_SIZE
+        next_layer = bytearray()
+
+        with memoryview(cur_layer) as view:
+            n_full = len(cur_layer) - len(cur_layer) % pair_size
+            for i in range(0, n_full, pair_size):
+                next_layer += hashlib.sha256(view[i:i + pair_size]).digest()
+
+            if n_full < len(cur_layer):
+                next_layer += hashlib.sha256(bytes(view[n_full:]) * 2).digest()
+
+        return next_layer
+
+    def build_tree(self):
+        self.reindex()
+
+        cur_layer = self.layers[-1]
+        if not cur_layer:
+            return None
+
+        while len(cur_layer) > self.HASH_SIZE:
+            cur_layer = self.hash_layer(cur_layer)
             self.layers.append(cur_layer)
 
-        return cur_layer[0].hex()
+        return cur_layer.hex()
 
-    def get_proof(self, e):
+    @staticmethod
+    def build_chunk(args):
+        packed, depth = args
+
+        cur_layer = bytearray()
+        for record in iter_elements(packed):
+            cur_layer += hashlib.sha256(record).digest()
+
+        layers = [cur_layer]
+        for _ in range(depth):
+            cur_layer = MHT.hash_layer(cur_layer)
+            layers.append(cur_layer)
+
+        return layers
+
+    @classmethod
+    def build_parallel(cls, items: List[Any], pool, depth=12):
+        chunk_size = 1 << depth
+
+        if len(items) <= chunk_size:
+            return cls(items)
+
+        tasks = [(pack_elements(items[i:i + chunk_size]), depth) for i in range(0, len(items), chunk_size)]
+        chunks = pool.map(cls.build_chunk, tasks)
+
+        tree = cls.__new__(cls)
+        tree.layers = [bytearray().join(chunk[level] for chunk in chunks) for level in range(depth + 1)]
+        tree.pending = {}
+        tree.merkle_root = tree.build_tree()
+
+        return tree
+
+    def rehash(self, lo: int, hi: int):
+        level = 0
+
+        while len(self.layers[level]) > self.HASH_SIZE:
+            cur_layer = self.layers[level]
+            n_nodes = len(cur_layer) // self.HASH_SIZE
+
+            if level + 1 == len(self.layers):
+                self.layers.append(bytearray())
+            next_layer = self.layers[level + 1]
+
+            lo, hi = lo // 2, (hi + 1) // 2
+            for i in range(lo, hi):
+                start = 2 * i * self.HASH_SIZE
+                if 2 * i + 1 < n_nodes:
+                    merged_hash = cur_layer[start:start + 2 * self.HASH_SIZE]
+                else:
+                    merged_hash = cur_layer[start:start + self.HASH_SIZE] * 2
+                parent_hash = hashlib.sha256(merged_hash).digest()
+
+                if i * self.HASH_SIZE < len(next_layer):
+                    next_layer[i * self.HASH_SIZE:(i + 1) * self.HASH_SIZE] = parent_hash
+                else:
+                    next_layer += parent_hash
+
+            level += 1
+
+        self.merkle_root = self.layers[level].hex()
+
+        return self.merkle_root
+
+    def extend_hashes(self, hashes: List[bytes]):
+        lo = len(self)
+
+        for idx, hash in enumerate(hashes, lo):
+            self.layers[0] += hash
+            self.pending[hash] = idx
+
+        if len(self.pending) > max(1024, len(self.index_keys) // self.REINDEX_RATIO):
+            self.reindex()
+
+        return self.rehash(lo, len(self))
+
+    def extend(self, items: List[Any]):
+        return self.extend_hashes([self.get_hash(e) for e in items])
+
+    def append(self, e):
+        return self.extend([e])
+
+    def set_leaf(self, idx: int, e):
+        old_hash = self.leaf(idx)
+        if self.pending.get(old_hash) == idx:
+            del self.pending[old_hash]
+
+        if e is None:
+            hash = self.EMPTY_LEAF
+        else:
+            hash = self.get_hash(e)
+            self.pending[hash] = idx
+
+        self.layers[0][idx * self.HASH_SIZE:(idx + 1) * self.HASH_SIZE] = hash
+
+        return self.rehash(idx, idx + 1)
+
+    def update(self, old_e, new_e):
+        idx = self.index_of(self.get_hash(old_e))
+
+        if idx is None:
+            raise ValueError(f"Element {old_e} not found in MHT")
+
+        return self.set_leaf(idx, new_e)
+
+    def invalidate(self, e):
+        idx = self.index_of(self.get_hash(e))
+
+        if idx is None:
+            raise ValueError(f"Element {e} not found in MHT")
+
+        return self.set_leaf(idx, None)
+
+    # ------------------------------------------------------------
+
+    def get_proof(self, e, idx=None):
         hash_chain = []
-        cur_idx = self.hash_2_idx.get(self.get_hash(e))
+        cur_idx = self.index_of(self.get_hash(e)) if idx is None else idx
 
-        for layer in self.layers[:-1]:
+        for level in range(len(self.layers) - 1):
+            n_nodes = len(self.layers[level]) // self.HASH_SIZE
             is_even = cur_idx % 2
             pair_idx = cur_idx - 1 if is_even else cur_idx + 1
 
-            if pair_idx >= len(layer):
-                pair_hash = layer[cur_idx]
+            if pair_idx >= n_nodes:
+                pair_hash = self.node(level, cur_idx)
                 position = "self"
             else:
-                pair_hash = layer[pair_idx]
+                pair_hash = self.node(level, pair_idx)
                 position = "left" if is_even else "right"
 
             hash_chain.append({"pair_hash": pair_hash.hex(), "position": position})
@@ -61,6 +228,27 @@ class MHT:
 
         return {"e": e, "hash_chain": hash_chain, "merkle_root": self.merkle_root}
 
+    def get_packed_chain(self, idx):
+        self_mask = 0
+        left_mask = 0
+        siblings = bytearray()
+        cur_idx = idx
+
+        for level in range(len(self.layers) - 1):
+            n_nodes = len(self.layers[level]) // self.HASH_SIZE
+            pair_idx = cur_idx ^ 1
+
+            if pair_idx >= n_nodes:
+                self_mask |= 1 << level
+            else:
+                siblings += self.layers[level][pair_idx * self.HASH_SIZE:(pair_idx + 1) * self.HASH_SIZE]
+                if cur_idx % 2:
+                    left_mask |= 1 << level
+
+            cur_idx //= 2
+
+        return len(self.layers) - 1, self_mask, left_mask, siblings
+
     @staticmethod
     def compute_root(proof):
         cur_hash = MHT.get_hash(proof["e"])
@@ -79,92 +267,390 @@ class MHT:
 
         return cur_hash.hex()
 
+    def get_multiproof(self, elements, idxs=None):
+        elements = list(elements)
+        if idxs is None:
+            idxs = [self.index_of(self.get_hash(e)) for e in elements]
+
+        siblings = []
+        known = sorted(set(idxs))
+
+        for level in range(len(self.layers) - 1):
+            n_nodes = len(self.layers[level]) // self.HASH_SIZE
+            known_set = set(known)
+            next_known = []
+
+            for idx in known:
+                pair_idx = idx ^ 1
+                if pair_idx < n_nodes and pair_idx not in known_set:
+                    siblings.append(self.node(level, pair_idx).hex())
+
+                if not next_known or next_known[-1] != idx // 2:
+                    next_known.append(idx // 2)
+
+            known = next_known
+
+        return {"e": elements, "leaf_idx": list(idxs), "n_leaves": len(self),
+                "siblings": siblings, "merkle_root": self.merkle_root}
+
+    @staticmethod
+    def compute_multiroot(proof):
+        nodes = {}
+
+        for e, idx in zip(proof["e"], proof["leaf_idx"]):
+            cur_hash = MHT.get_hash(e)
+            if nodes.setdefault(idx, cur_hash) != cur_hash:
+                raise ValueError("Conflicting leaves in multiproof")
+
+        siblings = iter(proof["siblings"])
+        layer_size = proof["n_leaves"]
+
+        while layer_size > 1:
+            next_nodes = {}
+
+            for idx in sorted(nodes):
+                if idx // 2 in next_nodes:
+                    continue
+
+                pair_idx = idx ^ 1
+                if pair_idx in nodes:
+                    pair_hash = nodes[pair_idx]
+                elif pair_idx < layer_size:
+                    pair_hash = bytes.fromhex(next(siblings))
+                else:
+                    pair_hash = nodes[idx]
+
+                if idx % 2:
+                    merged_hash = pair_hash + nodes[idx]
+                else:
+                    merged_hash = nodes[idx] + pair_hash
+
+                next_nodes[idx // 2] = hashlib.sha256(merged_hash).digest()
+
+            nodes = next_nodes
+            layer_size = (layer_size + 1) // 2
+
+        if next(siblings, None) is not None or list(nodes) != [0]:
+            raise ValueError("Malformed multiproof")
+
+        return nodes[0].hex()
+
 # ------------------------------------------------------------
 # ------------------------------------------------------------
 
 class AA_MHT:
-    def __init__(self, items):
-        self.items = items
-        self.initial_tree = MHT(self.items)
+    COMPACT_RATE = 2
+
+    PACKED_HEADER = struct.Struct('>BQQ')
+    PACKED_LENGTH = struct.Struct('>H')
+    PACKED_ROOTS = ("subtree_root", "initial_root", "addition_root", "deletion_root", "merkle_root")
+
+    def __init__(self, items, compact_threshold=None, initial_tree=None):
+        self.initial_tree = MHT(items) if initial_tree is None else initial_tree
         self.history = []
-        self.merkle_root = hex(int(self.initial_tree.merkle_root, 16) % curve_order)[2:]
+        self.history_offset = 0
+        self.fold_cursor = 0
+        self.compact_threshold = compact_threshold
+        self.locator = {}
+        self.initial_root = int(self.initial_tree.merkle_root, 16) % curve_order
+        self.addition_root = 0
+        self.deletion_root = 0
+        self.root_snapshot = None
+        self.compute_root()
 
     def compute_root(self):
-        initial_root = int(self.initial_tree.merkle_root, 16) % curve_order
-        add_root = 0
-        del_root = 0
+        arith_root = (self.initial_root + self.addition_root - self.deletion_root) % curve_order
 
-        for op in self.history:
-            tree = op['tree']
-            tree_root = int(tree.merkle_root, 16) % curve_order
+        self.merkle_root = hex(arith_root)[2:]
+        self.root_snapshot = None
 
-            if op['type'] == 'Add':
-                add_root = (add_root + tree_root) % curve_order
-            elif op['type'] == 'Del':
-                del_root = (del_root + tree_root) % curve_order
+    def get_root_snapshot(self):
+        if self.root_snapshot is None:
+            self.root_snapshot = {"initial_root": hex(self.initial_root)[2:],
+                                  "addition_root": hex(self.addition_root)[2:],
+                                  "deletion_root": hex(self.deletion_root)[2:],
+                                  "merkle_root": self.merkle_root,
+                                  "packed_roots": b''.join(root.to_bytes(MHT.HASH_SIZE, 'big') for root in
+                                                           (self.initial_root, self.addition_root,
+                                                            self.deletion_root, int(self.merkle_root, 16)))}
 
-        arith_root = (initial_root + add_root - del_root) % curve_order
+        return self.root_snapshot
 
-        self.merkle_root = hex(arith_root)[2:]
+    def index_tree(self, tree, is_live):
+        op_idx = self.history_offset + len(self.history) - 1
+
+        for idx, hash in enumerate(tree.iter_leaves()):
+            self.locator[hash] = (op_idx, idx, is_live)
 
     def addition(self, subtree):
+        tree = MHT(subtree)
         self.history.append({'type': 'Add',
-                             'tree': MHT(subtree)})
+                             'tree': tree})
+        self.index_tree(tree, True)
+        self.addition_root = (self.addition_root + int(tree.merkle_root, 16)) % curve_order
         self.compute_root()
+        self.auto_compact(len(subtree))
 
     def deletion(self, subtree):
+        tree = MHT(subtree)
         self.history.append({'type': 'Del',
-                             'tree': MHT(subtree)})
+                             'tree': tree})
+        self.index_tree(tree, False)
+        self.deletion_root = (self.deletion_root + int(tree.merkle_root, 16)) % curve_order
         self.compute_root()
+        self.auto_compact(len(subtree))
 
-    @staticmethod
-    def merge_hashes(hashes):
-        hash_sum = 0
+    def locate(self, e):
+        cur_hash = MHT.get_hash(e)
+        loc = self.locator.get(cur_hash)
 
-        for hash in hashes:
-            hash_val = int(hash, 16) % curve_order
-            hash_sum = (hash_sum + hash_val) % curve_order
+        if loc is None:
+            idx = self.initial_tree.index_of(cur_hash)
+            if idx is None:
+                raise ValueError(f"Element {e} not found in AA-MHT")
+            return self.initial_tree, idx
 
-        return hex(hash_sum)[2:]
+        op_idx, idx, is_live = loc
+        if not is_live:
+            raise ValueError(f"Element {e} has been deleted")
 
-    def get_proof(self, e):
-        cur_hash = self.initial_tree.get_hash(e)
-        subtree_proof = None
+        return self.history[op_idx - self.history_offset]['tree'], idx
+
+    # ------------------------------------------------------------
+
+    def fold_addition(self, op_idx, tree, lo, hi):
+        base = self.initial_tree
+        to_append = []
+
+        for idx in range(lo, hi):
+            hash = tree.leaf(idx)
+
+            if self.locator.get(hash) == (op_idx, idx, True):
+                del self.locator[hash]
+                if base.index_of(hash) is None:
+                    to_append.append(hash)
+
+        if to_append:
+            base.extend_hashes(to_append)
+
+    def fold_deletion(self, op_idx, tree, lo, hi):
+        base = self.initial_tree
+
+        for idx in range(lo, hi):
+            hash = tree.leaf(idx)
 
-        for op in reversed(self.history):
+            base_idx = base.index_of(hash)
+            if base_idx is not None:
+                base.set_leaf(base_idx, None)
+
+            if self.locator.get(hash) == (op_idx, idx, False):
+                del self.locator[hash]
+
+    def compact_step(self, budget, keep=0):
+        while budget > 0 and len(self.history) > keep:
+            op = self.history[0]
             tree = op['tree']
-            
-            if cur_hash in tree.hash_2_idx:
-                if op['type'] == 'Del':
-                    raise ValueError(f"Element {e} has been deleted")
-                elif op['type'] == 'Add':
-                    subtree_proof = tree.get_proof(e)
-                    break
-
-        if subtree_proof is None:
-            if cur_hash in self.initial_tree.hash_2_idx:
-                subtree_proof = self.initial_tree.get_proof(e)
-            else:
-                raise ValueError(f"Element {e} not found in AA-MHT")
+            hi = min(self.fold_cursor + budget, len(tree))
+
+            if op['type'] == 'Add':
+                self.fold_addition(self.history_offset, tree, self.fold_cursor, hi)
+            elif op['type'] == 'Del':
+                self.fold_deletion(self.history_offset, tree, self.fold_cursor, hi)
+
+            budget -= hi - self.fold_cursor
+            self.fold_cursor = hi
 
-        add_root_hashes = [op['tree'].merkle_root for op in self.history if op['type'] == 'Add']
-        del_root_hashes = [op['tree'].merkle_root for op in self.history if op['type'] == 'Del']
+            if self.fold_cursor == len(tree):
+                del self.history[0]
+                self.history_offset += 1
+                self.fold_cursor = 0
 
-        add_merged_root = self.merge_hashes(add_root_hashes)
-        del_merged_root = self.merge_hashes(del_root_hashes)
+    def compact(self):
+        while self.history:
+            self.compact_step(len(self.history[0]['tree']) + 1)
 
-        init_root = hex(int(self.initial_tree.merkle_root, 16) % curve_order)[2:]
+    def auto_compact(self, n_ingested):
+        if self.compact_threshold is not None and len(self.history) > self.compact_threshold:
+            self.compact_step(max(1, n_ingested * self.COMPACT_RATE), keep=self.compact_threshold)
+
+    def get_proof(self, e):
+        tree, idx = self.locate(e)
+        subtree_proof = tree.get_proof(e, idx)
+        roots = self.get_root_snapshot()
 
         proof = {"e": e,
                  "subtree_chain": subtree_proof["hash_chain"],
                  "subtree_root": subtree_proof["merkle_root"],
-                 "initial_root": init_root,
-                 "addition_root": add_merged_root,
-                 "deletion_root": del_merged_root,
-                 "merkle_root": self.merkle_root}
+                 "initial_root": roots["initial_root"],
+                 "addition_root": roots["addition_root"],
+                 "deletion_root": roots["deletion_root"],
+                 "merkle_root": roots["merkle_root"]}
 
         return proof
 
+    def get_multiproof(self, elements):
+        groups = {}
+
+        for e in elements:
+            tree, idx = self.locate(e)
+            group = groups.setdefault(id(tree), (tree, [], []))
+            group[1].append(e)
+            group[2].append(idx)
+
+        subtree_proofs = []
+        for tree, tree_elements, tree_idxs in groups.values():
+            subtree_proof = tree.get_multiproof(tree_elements, tree_idxs)
+            subtree_proofs.append({"e": subtree_proof["e"],
+                                   "leaf_idx": subtree_proof["leaf_idx"],
+                                   "n_leaves": subtree_proof["n_leaves"],
+                                   "siblings": subtree_proof["siblings"],
+                                   "subtree_root": subtree_proof["merkle_root"]})
+
+        roots = self.get_root_snapshot()
+
+        proof = {"subtrees": subtree_proofs,
+                 "initial_root": roots["initial_root"],
+                 "addition_root": roots["addition_root"],
+                 "deletion_root": roots["deletion_root"],
+                 "merkle_root": roots["merkle_root"]}
+
+        return proof
+
+    @staticmethod
+    def compute_aa_multiroot(proof):
+        for subtree_proof in proof["subtrees"]:
+            subtree_root = MHT.compute_multiroot(subtree_proof)
+
+            if int(subtree_root, 16) != int(subtree_proof["subtree_root"], 16):
+                raise ValueError("Subtree multiproof verification failed")
+
+        initial_root = int(proof["initial_root"], 16)
+        addition_root = int(proof["addition_root"], 16)
+        deletion_root = int(proof["deletion_root"], 16)
+
+        recomputed_aa_root = (initial_root + addition_root - deletion_root) % curve_order
+
+        return hex(recomputed_aa_root)[2:]
+
+    def get_packed_proof(self, e):
+        tree, idx = self.locate(e)
+        n_levels, self_mask, left_mask, siblings = tree.get_packed_chain(idx)
+
+        return b''.join((self.PACKED_HEADER.pack(n_levels, self_mask, left_mask),
+                         siblings,
+                         bytes.fromhex(tree.merkle_root),
+                         self.get_root_snapshot()["packed_roots"]))
+
+    @staticmethod
+    def encode_proof(proof):
+        self_mask = 0
+        left_mask = 0
+        siblings = []
+
+        for level, step in enumerate(proof["subtree_chain"]):
+            if step["position"] == "self":
+                self_mask |= 1 << level
+            else:
+                siblings.append(bytes.fromhex(step["pair_hash"]))
+                if step["position"] == "left":
+                    left_mask |= 1 << level
+
+        header = AA_MHT.PACKED_HEADER.pack(len(proof["subtree_chain"]), self_mask, left_mask)
+        roots = [bytes.fromhex(proof["subtree_root"])]
+        roots += [int(proof[key], 16).to_bytes(MHT.HASH_SIZE, 'big') for key in AA_MHT.PACKED_ROOTS[1:]]
+
+        return b''.join([header] + siblings + roots)
+
+    @staticmethod
+    def decode_proof(e, buf):
+        n_levels, self_mask, left_mask = AA_MHT.PACKED_HEADER.unpack_from(buf, 0)
+        offset = AA_MHT.PACKED_HEADER.size
+        cur_hash = MHT.get_hash(e)
+        subtree_chain = []
+
+        for level in range(n_levels):
+            if self_mask >> level & 1:
+                pair_hash = cur_hash
+                position = "self"
+                merged_hash = cur_hash + cur_hash
+            else:
+                pair_hash = bytes(buf[offset:offset + MHT.HASH_SIZE])
+                offset += MHT.HASH_SIZE
+
+                if left_mask >> level & 1:
+                    position = "left"
+                    merged_hash = pair_hash + cur_hash
+                else:
+                    position = "right"
+                    merged_hash = cur_hash + pair_hash
+
+            subtree_chain.append({"pair_hash": pair_hash.hex(), "position": position})
+            cur_hash = hashlib.sha256(merged_hash).digest()
+
+        proof = {"e": e, "subtree_chain": subtree_chain,
+                 "subtree_root": bytes(buf[offset:offset + MHT.HASH_SIZE]).hex()}
+        offset += MHT.HASH_SIZE
+
+        for key in AA_MHT.PACKED_ROOTS[1:]:
+            proof[key] = hex(int.from_bytes(buf[offset:offset + MHT.HASH_SIZE], 'big'))[2:]
+            offset += MHT.HASH_SIZE
+
+        return proof
+
+    @staticmethod
+    def verify_packed(e, buf):
+        n_levels, self_mask, left_mask = AA_MHT.PACKED_HEADER.unpack_from(buf, 0)
+        offset = AA_MHT.PACKED_HEADER.size
+        size = MHT.HASH_SIZE
+        sha256 = hashlib.sha256
+        cur_hash = MHT.get_hash(e)
+        buf = bytes(buf)
+
+        for level in range(n_levels):
+            if self_mask >> level & 1:
+                cur_hash = sha256(cur_hash + cur_hash).digest()
+                continue
+
+            pair_hash = buf[offset:offset + size]
+            offset += size
+
+            if left_mask >> level & 1:
+                cur_hash = sha256(pair_hash + cur_hash).digest()
+            else:
+                cur_hash = sha256(cur_hash + pair_hash).digest()
+
+        if buf[offset:offset + size] != cur_hash:
+            return False
+
+        initial_root = int.from_bytes(buf[offset + size:offset + 2 * size], 'big')
+        addition_root = int.from_bytes(buf[offset + 2 * size:offset + 3 * size], 'big')
+        deletion_root = int.from_bytes(buf[offset + 3 * size:offset + 4 * size], 'big')
+        merkle_root = int.from_bytes(buf[offset + 4 * size:offset + 5 * size], 'big')
+
+        return (initial_root + addition_root - deletion_root) % curve_order == merkle_root
+
+    @staticmethod
+    def packed_root(buf):
+        return int.from_bytes(buf[-MHT.HASH_SIZE:], 'big')
+
+    @staticmethod
+    def encode_vo(bufs):
+        return b''.join(AA_MHT.PACKED_LENGTH.pack(len(buf)) + buf for buf in bufs)
+
+    @staticmethod
+    def decode_vo(vo):
+        view = memoryview(vo)
+        bufs = []
+        offset = 0
+
+        while offset < len(view):
+            (length,) = AA_MHT.PACKED_LENGTH.unpack_from(view, offset)
+            offset += AA_MHT.PACKED_LENGTH.size
+            bufs.append(view[offset:offset + length])
+            offset += length
+
+        return bufs
+
     @staticmethod
     def compute_aa_root(proof):
         subtree_root = MHT.compute_root({"e": proof.get("e"),
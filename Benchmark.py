@@ -0,0 +1,207 @@
+import argparse
+import Config
+import math
+import pickle
+import random
+from AA_MHT import AA_MHT
+from Crypto import CuckooFilter, HomomorphicBLS
+from py_ecc.optimized_bn128 import curve_order
+
+
+def bench_proof(n_init, n_rounds, batch_size, n_probes, interval, compact_threshold=None):
+    timer = Config.Timer()
+
+    init_items = list(range(n_init))
+    cs_tree = AA_MHT(init_items, compact_threshold=compact_threshold)
+
+    next_node = n_init
+
+    for i in range(n_rounds):
+        round_idx = i + 1
+
+        add_items = list(range(next_node, next_node + batch_size))
+        next_node += batch_size
+        cs_tree.addition(add_items)
+
+        if round_idx % 4 == 0:
+            cs_tree.deletion(add_items[:batch_size // 10])
+
+        if round_idx % interval == 0:
+            probes = random.sample(init_items[:n_init // 2], min(n_probes, n_init // 2))
+
+            timer.tick()
+            for e in probes:
+                cs_tree.locate(e)
+            t_locate = timer.tock()
+
+            timer.tick()
+            for e in probes:
+                cs_tree.get_proof(e)
+            t_proof = timer.tock()
+
+            print(f"[RESULT] [ROUND {round_idx}] "
+                  f"|H|={len(cs_tree.history)} "
+                  f"locate: {t_locate * 1000 / len(probes):.1f}us/elem "
+                  f"get_proof: {t_proof * 1000 / len(probes):.1f}us/elem")
+
+
+def bench_multiproof(n_init, n_rounds, batch_size, n_probes):
+    timer = Config.Timer()
+
+    cs_tree = AA_MHT(list(range(n_init)))
+    next_node = n_init
+
+    for _ in range(n_rounds):
+        cs_tree.addition(list(range(next_node, next_node + batch_size)))
+        next_node += batch_size
+
+    rq = random.sample(range(next_node), min(n_probes, next_node))
+
+    timer.tick()
+    proofs = [cs_tree.get_proof(e) for e in rq]
+    t_gen = timer.tock()
+
+    timer.tick()
+    for proof in proofs:
+        cs_tree.compute_aa_root(proof)
+    t_veri = timer.tock()
+
+    print(f"[RESULT] [SINGLE] |rq|={len(rq)} "
+          f"VO: {len(pickle.dumps(proofs)) / 1024:.1f}KB "
+          f"gen: {t_gen:.1f}ms veri: {t_veri:.1f}ms")
+
+    timer.tick()
+    proof = cs_tree.get_multiproof(rq)
+    t_gen = timer.tock()
+
+    timer.tick()
+    cs_tree.compute_aa_multiroot(proof)
+    t_veri = timer.tock()
+
+    print(f"[RESULT] [MULTI] |rq|={len(rq)} "
+          f"VO: {len(pickle.dumps(proof)) / 1024:.1f}KB "
+          f"gen: {t_gen:.1f}ms veri: {t_veri:.1f}ms")
+
+    timer.tick()
+    vo = cs_tree.encode_vo([cs_tree.get_packed_proof(e) for e in rq])
+    t_gen = timer.tock()
+
+    timer.tick()
+    for e, buf in zip(rq, cs_tree.decode_vo(vo)):
+        cs_tree.verify_packed(e, buf)
+    t_veri = timer.tock()
+
+    print(f"[RESULT] [PACKED] |rq|={len(rq)} "
+          f"VO: {len(vo) / 1024:.1f}KB "
+          f"gen: {t_gen:.1f}ms veri: {t_veri:.1f}ms")
+
+
+def bench_bls(n_epochs):
+    timer = Config.Timer()
+
+    bls_sk, bls_pk = HomomorphicBLS.gen_key()
+
+    epochs = []
+    for i in range(n_epochs):
+        ts, root = f"ts{i}", random.randrange(curve_order)
+        epochs.append((ts, root, HomomorphicBLS.sign_initial(bls_sk, ts, root)))
+
+    timer.tick()
+    for ts, root, signature in epochs:
+        HomomorphicBLS.verify(bls_pk, ts, root, signature)
+    t_single = timer.tock()
+
+    timer.tick()
+    HomomorphicBLS.batch_verify(bls_pk, epochs)
+    t_batch = timer.tock()
+
+    ts, root, signature = epochs[n_epochs // 2]
+    epochs[n_epochs // 2] = (ts, (root + 1) % curve_order, signature)
+
+    timer.tick()
+    _, bad_idxs = HomomorphicBLS.batch_verify(bls_pk, epochs)
+    t_bisect = timer.tock()
+
+    print(f"[RESULT] [BLS] |epochs|={n_epochs} "
+          f"single: {t_single:.0f}ms batch: {t_batch:.0f}ms "
+          f"bisect: {t_bisect:.0f}ms bad={bad_idxs}")
+
+
+def bench_cf(n_items, n_probes):
+    timer = Config.Timer()
+
+    vals = [random.getrandbits(512) for _ in range(n_items)]
+    probes = vals[:n_probes] + [random.getrandbits(512) for _ in range(n_probes)]
+
+    cf = CuckooFilter(capacity=n_items // 2)
+
+    timer.tick()
+    for val in vals:
+        cf.insert(val)
+    t_ins = timer.tock()
+
+    timer.tick()
+    for val in probes:
+        cf.seek(val)
+    t_seek = timer.tock()
+
+    print(f"[RESULT] [SINGLE] |S|={n_items} "
+          f"insert: {t_ins * 1000 / n_items:.2f}us/elem seek: {t_seek * 1000 / len(probes):.2f}us/elem")
+
+    cf = CuckooFilter(capacity=n_items // 2)
+
+    timer.tick()
+    cf.insert_many(vals)
+    t_ins = timer.tock()
+
+    timer.tick()
+    cf.contains_many(probes)
+    t_seek = timer.tock()
+
+    print(f"[RESULT] [BATCH] |S|={n_items} "
+          f"insert: {t_ins * 1000 / n_items:.2f}us/elem seek: {t_seek * 1000 / len(probes):.2f}us/elem")
+
+
+def bench_cf_sizing(n_items, n_probes):
+    vals = [random.getrandbits(512) for _ in range(n_items)]
+    probes = [random.getrandbits(512) for _ in range(n_probes)]
+
+    for fp_size in (8, 12, 16, 32):
+        for load in (0.125, 0.5, 0.9, 0.95):
+            cf = CuckooFilter(capacity=math.ceil(n_items / (4 * load)), max_kicks=CuckooFilter.max_kicks_for(load),
+                              fp_size=fp_size)
+            cf.insert_many(vals)
+
+            stats = cf.stats()
+
+            print(f"[RESULT] [CF f={fp_size} a={load}] |S|={n_items} "
+                  f"mem: {stats['n_bytes'] / 1024:.0f}KB ({stats['n_bytes'] * 8 / n_items:.1f}bits/elem) "
+                  f"load: {stats['load_factor']:.3f} failed: {stats['n_failed']} "
+                  f"fp: {cf.fp_rate:.2e} (measured {cf.contains_many(probes).mean():.2e})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--target', type=str, default="proof")
+    parser.add_argument('--init_size', type=int, default=10000)
+    parser.add_argument('--batch_size', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=400)
+    parser.add_argument('--probes', type=int, default=500)
+    parser.add_argument('--interval', type=int, default=50)
+    parser.add_argument('--compact', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.target == "proof":
+        bench_proof(args.init_size, args.rounds, args.batch_size, args.probes, args.interval, args.compact)
+    elif args.target == "multiproof":
+        bench_multiproof(args.init_size, args.rounds, args.batch_size, args.probes)
+    elif args.target == "bls":
+        bench_bls(args.rounds)
+    elif args.target == "cf":
+        bench_cf(args.init_size, args.probes)
+    elif args.target == "cf_sizing":
+        bench_cf_sizing(args.init_size, args.probes)
+
+
+if __name__ == "__main__":
+    main()
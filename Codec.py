@@ -0,0 +1,52 @@
+import struct
+
+
+ELEMENT = struct.Struct('>BQQ')
+ELEMENT_SIZE = ELEMENT.size
+
+NODE_TAG = 0
+EDGE_TAG = 1
+
+INT_OFFSET = 1 << 63
+
+VALUE_SIZE = 64
+
+VERSION = 1
+
+
+def encode_element(e):
+    if isinstance(e, tuple):
+        u, v = e
+        if v < u:
+            u, v = v, u
+        return ELEMENT.pack(EDGE_TAG, u + INT_OFFSET, v + INT_OFFSET)
+
+    return ELEMENT.pack(NODE_TAG, e + INT_OFFSET, 0)
+
+
+def decode_element(buf, offset=0):
+    tag, u, v = ELEMENT.unpack_from(buf, offset)
+
+    if tag == EDGE_TAG:
+        return u - INT_OFFSET, v - INT_OFFSET
+
+    return u - INT_OFFSET
+
+
+def pack_elements(items):
+    return b''.join(map(encode_element, items))
+
+
+def iter_elements(buf):
+    for offset in range(0, len(buf), ELEMENT_SIZE):
+        yield buf[offset:offset + ELEMENT_SIZE]
+
+# ------------------------------------------------------------
+# ------------------------------------------------------------
+
+def value_width(n_bits):
+    return VALUE_SIZE * max(1, -(-n_bits // (8 * VALUE_SIZE)))
+
+
+def encode_value(val):
+    return val.to_bytes(value_width(val.bit_length()), 'big')
@@ -1,5 +1,9 @@
+import Codec
+import hashlib
+import mmap
 import os
 import pickle
+import struct
 import time
 
 
@@ -28,18 +32,28 @@ class CacheManager:
     def key_path(self):
         return os.path.join(self.CACHE_DIR, "Keys.pkl")
 
-    def data_path(self, idx, init_ratio, scale=None):
+    def data_path(self, idx, init_ratio, scale=None, key_fp=""):
         GDB = self.DATASET_MAP.get(idx, f"DB{idx}")
 
         if scale is not None:
-            GDB_NAME = f"Enc_{GDB}_Scale_{int(scale)}_Q_{SUB_IDX}.pkl"
+            GDB_NAME = f"Enc_{GDB}_Scale_{int(scale)}_Q_{SUB_IDX}_{key_fp}_v{Codec.VERSION}.bin"
         elif init_ratio < 1.0:
-            GDB_NAME = f"Enc_{GDB}_Stream_{init_ratio}.pkl"
+            GDB_NAME = f"Enc_{GDB}_Stream_{init_ratio}_{key_fp}_v{Codec.VERSION}.bin"
         else:
-            GDB_NAME = f"Enc_{GDB}_Full.pkl"
+            GDB_NAME = f"Enc_{GDB}_Full_{key_fp}_v{Codec.VERSION}.bin"
+
+        return os.path.join(self.CACHE_DIR, GDB_NAME)
+
+    def stream_path(self, idx, init_ratio, batch_size, key_fp=""):
+        GDB = self.DATASET_MAP.get(idx, f"DB{idx}")
+        GDB_NAME = f"Enc_{GDB}_Stream_{init_ratio}_Batch_{batch_size}_{key_fp}_v{Codec.VERSION}.bin"
 
         return os.path.join(self.CACHE_DIR, GDB_NAME)
 
+    @staticmethod
+    def key_fingerprint(rsa_keys):
+        return hashlib.sha256(Codec.encode_value(rsa_keys['N']) + Codec.encode_value(rsa_keys['E'])).hexdigest()[:16]
+
     @staticmethod
     def save(data, path):
         with open(path, "wb") as f:
@@ -52,6 +66,75 @@ class CacheManager:
                 return pickle.load(f)
         return None
 
+
+class EncStore:
+    MAGIC = b"SMFE"
+    HEADER = struct.Struct('>4sBxH8s')
+
+    def __init__(self, path, record_size, key_fp):
+        self.path = path
+        self.record_size = record_size
+        self.header = self.HEADER.pack(self.MAGIC, Codec.VERSION, record_size, bytes.fromhex(key_fp))
+
+    def __len__(self):
+        if not self.exists():
+            return 0
+        return (os.path.getsize(self.path) - self.HEADER.size) // self.record_size
+
+    def exists(self):
+        if not os.path.exists(self.path):
+            return False
+
+        with open(self.path, "rb") as f:
+            return f.read(self.HEADER.size) == self.header
+
+    def write(self, f, values, chunk_size):
+        chunk = []
+
+        for val in values:
+            chunk.append(val.to_bytes(self.record_size, 'big'))
+
+            if len(chunk) == chunk_size:
+                f.write(b''.join(chunk))
+                chunk.clear()
+
+        f.write(b''.join(chunk))
+
+    def build(self, values, chunk_size=65536):
+        tmp_path = self.path + ".tmp"
+
+        with open(tmp_path, "wb") as f:
+            f.write(self.header)
+            self.write(f, values, chunk_size)
+
+        os.replace(tmp_path, self.path)
+
+    def append(self, values, offset, chunk_size=65536):
+        if not self.exists():
+            self.build([])
+
+        # records past offset are a stale or partial tail, the new batch replaces them
+        with open(self.path, "r+b") as f:
+            f.truncate(self.HEADER.size + offset * self.record_size)
+            f.seek(0, os.SEEK_END)
+            self.write(f, values, chunk_size)
+
+    def load(self):
+        if not self.exists():
+            return None
+
+        with open(self.path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return memoryview(buf)[self.HEADER.size:self.HEADER.size + len(self) * self.record_size]
+
+    def iter_records(self, start=0, count=None):
+        buf = self.load()
+        end = len(buf) if count is None else (start + count) * self.record_size
+
+        for offset in range(start * self.record_size, end, self.record_size):
+            yield buf[offset:offset + self.record_size]
+
 # ------------------------------------------------------------
 # ------------------------------------------------------------
 
@@ -125,4 +208,20 @@ N_ROUNDS = 67
 TIMESTAMP_SIZE = 20
 
 SUB_IDX = "3n3e"
+QUERY_FILE = None
 QUERY_INTERVAL = 1
+
+COMPACT_THRESHOLD = None
+PROOF_MODE = "single"
+PROOF_WORKERS = 0
+AUDIT = False
+BLIND_POOL_SIZE = 1024
+PSI_CHUNK = 1024
+CF_SHARDS = 0
+CF_LOAD = 0.9
+CF_FP_BITS = 12
+
+DEPLOY = None
+N_CLIENTS = 4
+CLIENT_QUERIES = 10
+CS_WORKERS = 0
@@ -1,18 +1,100 @@
 import hashlib
+import math
 import numpy as np
 import random
 import secrets
-from py_ecc.optimized_bn128 import add, curve_order, G1, G2, multiply, neg, pairing
+import threading
+import weakref
+from Codec import encode_element, encode_value, VALUE_SIZE
+from collections import deque
+from functools import lru_cache
+from multiprocessing import resource_tracker, shared_memory
+from py_ecc.optimized_bn128 import (add, b, curve_order, double, field_modulus, FQ, FQ12,
+                                    G1, G2, is_inf, is_on_curve, multiply, neg, normalize, twist, Z1)
+from py_ecc.optimized_bn128.optimized_pairing import pseudo_binary_encoding
 from sympy import mod_inverse, randprime
 
 
+class FixedBaseTable:
+    def __init__(self, base, window=8, rows=None):
+        self.window = window
+        self.mask = (1 << window) - 1
+
+        if rows is not None:
+            self.rows = rows
+            return
+
+        self.rows = []
+        cur_base = base
+
+        for _ in range(-(-curve_order.bit_length() // window)):
+            row = [cur_base]
+            for _ in range(self.mask - 1):
+                row.append(add(row[-1], cur_base))
+            self.rows.append(row)
+
+            cur_base = add(row[-1], cur_base)
+
+    def multiply(self, n):
+        n %= curve_order
+        result = Z1
+        row_idx = 0
+
+        while n:
+            digit = n & self.mask
+            if digit:
+                result = add(result, self.rows[row_idx][digit - 1])
+            n >>= self.window
+            row_idx += 1
+
+        return result
+
+    def dump(self):
+        return {'window': self.window,
+                'rows': [[(x.n, y.n, z.n) for x, y, z in row] for row in self.rows]}
+
+    @classmethod
+    def load(cls, data):
+        rows = [[(FQ(x), FQ(y), FQ(z)) for x, y, z in row] for row in data['rows']]
+        return cls(None, window=data['window'], rows=rows)
+
+
 class EllipticCurveUtils:
     BASE_POINT = multiply(G1, 5201314)
+    TABLES = {}
+
+    @staticmethod
+    def get_table(name):
+        table = EllipticCurveUtils.TABLES.get(name)
+
+        if table is None:
+            base = G1 if name == 'G1' else EllipticCurveUtils.BASE_POINT
+            table = FixedBaseTable(base)
+            EllipticCurveUtils.TABLES[name] = table
+
+        return table
+
+    @staticmethod
+    def dump_tables():
+        return {name: EllipticCurveUtils.get_table(name).dump() for name in ('G1', 'BASE_POINT')}
+
+    @staticmethod
+    def load_tables(data):
+        for name, table in data.items():
+            EllipticCurveUtils.TABLES[name] = FixedBaseTable.load(table)
+
+    @staticmethod
+    def g1_mul(n):
+        return EllipticCurveUtils.get_table('G1').multiply(n)
+
+    @staticmethod
+    def base_mul(n):
+        return EllipticCurveUtils.get_table('BASE_POINT').multiply(n)
 
     @staticmethod
     def data_2_scalar(data):
-        if isinstance(data, int):
-            data_bytes = str(data).encode()
+        if isinstance(data, (int, tuple)):
+            data_bytes = encode_element(data)
         elif isinstance(data, str):
             data_bytes = data.encode()
         elif isinstance(data, bytes):
@@ -23,12 +105,133 @@ class EllipticCurveUtils:
         return int.from_bytes(hashlib.sha256(data_bytes).digest(), 'big') % curve_order
 
     @staticmethod
+    @lru_cache(maxsize=64)
     def ts_2_point(ts):
         scalar = EllipticCurveUtils.data_2_scalar(ts)
-        return multiply(G1, scalar)
+        return EllipticCurveUtils.g1_mul(scalar)
+
+
+class G2Lines:
+    FROBENIUS = None
+    HARD_EXPONENT = (field_modulus ** 4 - field_modulus ** 2 + 1) // curve_order
+
+    def __init__(self, q):
+        q12 = twist(q)
+        self.coeffs = []
+        den = FQ12.one()
+        r = q12
+
+        for v in pseudo_binary_encoding[63::-1]:
+            den = den * den * self.add_line(r, r)
+            r = double(r)
+
+            if v:
+                step = q12 if v == 1 else neg(q12)
+                den = den * self.add_line(r, step)
+                r = add(r, step)
+
+        q1 = (q12[0] ** field_modulus, q12[1] ** field_modulus, q12[2] ** field_modulus)
+        nq2 = (q1[0] ** field_modulus, -q1[1] ** field_modulus, q1[2] ** field_modulus)
+
+        den = den * self.add_line(r, q1)
+        r = add(r, q1)
+        den = den * self.add_line(r, nq2)
+
+        self.den_inv = FQ12.one() / den
+
+    def add_line(self, p1, p2):
+        x1, y1, z1 = p1
+        x2, y2, z2 = p2
+        m_numerator = y2 * z1 - y1 * z2
+        m_denominator = x2 * z1 - x1 * z2
+
+        if m_denominator == FQ12.zero():
+            if m_numerator != FQ12.zero():
+                self.coeffs.append((z1, FQ12.zero(), -x1))
+                return z1
+
+            m_numerator = 3 * x1 * x1
+            m_denominator = 2 * y1 * z1
+
+        self.coeffs.append((m_numerator * z1, -(m_denominator * z1), m_denominator * y1 - m_numerator * x1))
+
+        return m_denominator * z1
+
+    @staticmethod
+    def miller_product(pairs):
+        points = []
+        for lines, p in pairs:
+            if not is_inf(p):
+                x, y = normalize(p)
+                points.append((lines.coeffs, x.n, y.n))
+
+        f = FQ12.one()
+        k = 0
+
+        for v in pseudo_binary_encoding[63::-1]:
+            f = f * f
+            for coeffs, x, y in points:
+                c_x, c_y, c_0 = coeffs[k]
+                f = f * (c_x * x + c_y * y + c_0)
+            k += 1
+
+            if v:
+                for coeffs, x, y in points:
+                    c_x, c_y, c_0 = coeffs[k]
+                    f = f * (c_x * x + c_y * y + c_0)
+                k += 1
+
+        for _ in range(2):
+            for coeffs, x, y in points:
+                c_x, c_y, c_0 = coeffs[k]
+                f = f * (c_x * x + c_y * y + c_0)
+            k += 1
+
+        for lines, p in pairs:
+            if not is_inf(p):
+                f = f * lines.den_inv
+
+        return f
+
+    @staticmethod
+    def frobenius(f, power=1):
+        if G2Lines.FROBENIUS is None:
+            w_q = FQ12([0, 1] + [0] * 10) ** field_modulus
+            rows = [FQ12.one()]
+            for _ in range(11):
+                rows.append(rows[-1] * w_q)
+            G2Lines.FROBENIUS = [row.coeffs for row in rows]
+
+        coeffs = f.coeffs
+        for _ in range(power):
+            coeffs = [sum(c * row[j] for c, row in zip(coeffs, G2Lines.FROBENIUS)) % field_modulus
+                      for j in range(12)]
+
+        return FQ12(coeffs)
+
+    @staticmethod
+    def final_exponentiate(f):
+        f = G2Lines.frobenius(f, 6) / f
+        f = G2Lines.frobenius(f, 2) * f
+
+        return f ** G2Lines.HARD_EXPONENT
 
 
 class HomomorphicBLS:
+    LINES = {}
+
+    @staticmethod
+    def get_lines(q):
+        x, y = normalize(q)
+        key = (x.coeffs, y.coeffs)
+
+        lines = HomomorphicBLS.LINES.get(key)
+        if lines is None:
+            lines = G2Lines(q)
+            HomomorphicBLS.LINES[key] = lines
+
+        return lines
+
     @staticmethod
     def gen_key():
         sk = secrets.randbelow(curve_order - 1) + 1
@@ -39,7 +242,7 @@ class HomomorphicBLS:
     def sign_initial(sk, ts, root):
         p_ts = EllipticCurveUtils.ts_2_point(ts)
 
-        p_root = multiply(EllipticCurveUtils.BASE_POINT, root % curve_order)
+        p_root = EllipticCurveUtils.base_mul(root)
 
         p_msg = add(p_ts, p_root)
 
@@ -51,7 +254,7 @@ class HomomorphicBLS:
         p_ts_ = EllipticCurveUtils.ts_2_point(ts_)
         p_ts = add(p_ts_, neg(p__ts))
 
-        p_root = multiply(EllipticCurveUtils.BASE_POINT, root % curve_order)
+        p_root = EllipticCurveUtils.base_mul(root)
 
         p_msg = add(p_ts, p_root)
 
@@ -62,17 +265,67 @@ class HomomorphicBLS:
         return add(_sigma, sigma_)
 
     @staticmethod
-    def verify(pk, ts, root, signature):
+    def msg_point(ts, root):
         p_ts = EllipticCurveUtils.ts_2_point(ts)
 
-        p_root = multiply(EllipticCurveUtils.BASE_POINT, root % curve_order)
+        p_root = EllipticCurveUtils.base_mul(root)
 
-        p_msg = add(p_ts, p_root)
+        return add(p_ts, p_root)
+
+    @staticmethod
+    def pairing_check(pk, p_msg, signature):
+        f = G2Lines.miller_product([(HomomorphicBLS.get_lines(G2), signature),
+                                    (HomomorphicBLS.get_lines(neg(pk)), p_msg)])
+
+        return G2Lines.final_exponentiate(f) == FQ12.one()
+
+    @staticmethod
+    def verify(pk, ts, root, signature):
+        p_msg = HomomorphicBLS.msg_point(ts, root)
+
+        if not is_on_curve(signature, b):
+            raise ValueError("Invalid input - point Q is not on the correct curves")
+
+        return HomomorphicBLS.pairing_check(pk, p_msg, signature)
+
+    @staticmethod
+    def batch_verify(pk, entries, bits=64):
+        p_msgs = []
+        signatures = []
+
+        for ts, root, signature in entries:
+            if not is_on_curve(signature, b):
+                raise ValueError("Invalid input - point Q is not on the correct curves")
+
+            p_msgs.append(HomomorphicBLS.msg_point(ts, root))
+            signatures.append(signature)
+
+        def check(idxs):
+            if len(idxs) == 1:
+                return HomomorphicBLS.pairing_check(pk, p_msgs[idxs[0]], signatures[idxs[0]])
+
+            p_msg, signature = Z1, Z1
+            for idx in idxs:
+                r = secrets.randbits(bits) | 1
+                p_msg = add(p_msg, multiply(p_msgs[idx], r))
+                signature = add(signature, multiply(signatures[idx], r))
+
+            return HomomorphicBLS.pairing_check(pk, p_msg, signature)
+
+        def bisect(idxs, is_bad=False):
+            if not is_bad and check(idxs):
+                return []
+            if len(idxs) == 1:
+                return list(idxs)
+
+            mid = len(idxs) // 2
+            bad_idxs = bisect(idxs[:mid])
 
-        lhs = pairing(G2, signature)
-        rhs = pairing(pk, p_msg)
+            return bad_idxs + bisect(idxs[mid:], is_bad=not bad_idxs)
 
-        return lhs == rhs
+        bad_idxs = bisect(list(range(len(entries)))) if entries else []
+
+        return not bad_idxs, bad_idxs
 
 # ------------------------------------------------------------
 # ------------------------------------------------------------
@@ -89,19 +342,174 @@ def gen_rsa_keys(bits=512, e=65537):
 
     d = mod_inverse(e, phi)
 
-    return n, e, d
+    return n, e, d, p, q
+
+
+def recover_rsa_factors(n, e, d, max_tries=100):
+    k = e * d - 1
+    t = (k & -k).bit_length() - 1
+    r = k >> t
+
+    for g in range(2, max_tries + 2):
+        x = pow(g, r, n)
+
+        for _ in range(t):
+            y = x * x % n
+            if y == 1 and x not in (1, n - 1):
+                p = math.gcd(x - 1, n)
+                return p, n // p
+            if y == 1:
+                break
+            x = y
+
+    return None
+
+
+def rsa_crt_params(n, e, d, p=None, q=None):
+    if p is None or q is None:
+        factors = recover_rsa_factors(n, e, d)
+        if factors is None:
+            return None
+        p, q = factors
+
+    if p * q != n:
+        return None
+
+    return p, q, d % (p - 1), d % (q - 1), pow(q, -1, p)
+
+
+def rsa_sign(val, rsa_keys):
+    crt = rsa_keys.get('CRT')
+
+    if crt is None:
+        return pow(val, rsa_keys['D'], rsa_keys['N'])
+
+    p, q, dp, dq, q_inv = crt
+    m_p = pow(val, dp, p)
+    m_q = pow(val, dq, q)
+
+    return m_q + (q_inv * (m_p - m_q) % p) * q
+
+
+class BlindingPool:
+    def __init__(self, n, e, size=1024, background=True):
+        self.n = n
+        self.e = e
+        self.size = size
+        self.low_water = size // 4
+        self.background = background
+
+        self.pairs = deque()
+        self.lock = threading.Lock()
+        self.worker = None
+
+        self.refill()
+
+    def __len__(self):
+        return len(self.pairs)
+
+    @staticmethod
+    def gen_pairs(n, e, count):
+        rs = [secrets.randbelow(n - 2) + 2 for _ in range(count)]
+
+        prefix = [1] * count
+        acc = 1
+        for i, r in enumerate(rs):
+            prefix[i] = acc
+            acc = acc * r % n
+
+        try:
+            inv = pow(acc, -1, n)
+        except ValueError:
+            return BlindingPool.gen_pairs(n, e, count)
+
+        r_invs = [0] * count
+        for i in range(count - 1, -1, -1):
+            r_invs[i] = prefix[i] * inv % n
+            inv = inv * rs[i] % n
+
+        return [(pow(r, e, n), r_inv) for r, r_inv in zip(rs, r_invs)]
+
+    def refill(self):
+        deficit = self.size - len(self.pairs)
+
+        if deficit > 0:
+            self.pairs.extend(self.gen_pairs(self.n, self.e, deficit))
+
+    def refill_async(self):
+        with self.lock:
+            if self.worker is not None and self.worker.is_alive():
+                return
+
+            self.worker = threading.Thread(target=self.refill, daemon=True)
+            self.worker.start()
+
+    def draw(self, count):
+        with self.lock:
+            n_ready = min(count, len(self.pairs))
+            pairs = [self.pairs.popleft() for _ in range(n_ready)]
+
+        if n_ready < count:
+            pairs.extend(self.gen_pairs(self.n, self.e, count - n_ready))
+
+        if self.background and len(self.pairs) < self.low_water:
+            self.refill_async()
+
+        return pairs
 
 
 class CuckooFilter:
-    def __init__(self, capacity, bucket_size=4, max_kicks=100):
+    ALT_TABLE_BITS = 16
+    EMPTY_VALUE = bytes(VALUE_SIZE)
+
+    def __init__(self, capacity, bucket_size=4, max_kicks=100, buckets=None, fp_size=12):
         self.n_buckets = capacity
         self.bucket_size = bucket_size
         self.max_kicks = max_kicks
-        self.fp_size = 12
+        self.fp_size = fp_size
         self.fp_mask = (1 << self.fp_size) - 1
-        self.buckets = np.zeros((self.n_buckets, self.bucket_size), dtype=np.uint16)
+
+        if buckets is None:
+            buckets = np.zeros((self.n_buckets, self.bucket_size), dtype=self.fp_dtype(fp_size))
+        self.buckets = buckets
         self.n_items = 0
 
+        self.n_kicks = 0
+        self.n_failed = 0
+
+        self.alt_table = None
+        if fp_size <= self.ALT_TABLE_BITS:
+            self.alt_table = self.gen_alt_table(self.n_buckets, self.fp_size)
+
+    @staticmethod
+    def max_kicks_for(load):
+        # random-walk insertion paths grow quickly once a 4-way filter passes ~90% load
+        return max(100, math.ceil(30 / max(1 - load, 0.01)))
+
+    @staticmethod
+    def fp_dtype(fp_size):
+        for dtype in (np.uint8, np.uint16, np.uint32):
+            if fp_size <= np.dtype(dtype).itemsize * 8:
+                return dtype
+
+        raise ValueError(f"Unsupported fingerprint size: {fp_size} bits")
+
+    @property
+    def n_bytes(self):
+        return self.buckets.nbytes
+
+    @property
+    def load_factor(self):
+        return self.n_items / self.buckets.size
+
+    @property
+    def fp_rate(self):
+        return 1 - (1 - 1 / self.fp_mask) ** (2 * self.bucket_size * self.load_factor)
+
+    def stats(self):
+        return {"n_items": self.n_items, "n_blocks": 1, "load_factor": self.load_factor,
+                "n_kicks": self.n_kicks, "n_failed": self.n_failed, "n_bytes": self.n_bytes}
+
     @staticmethod
     def to_int_hash(data, salt=b''):
         hasher = hashlib.sha256()
@@ -118,57 +526,108 @@ class CuckooFilter:
 
         return int.from_bytes(digest[:8], byteorder='big', signed=False)
 
-    def get_fp_and_indices(self, e):
-        if hasattr(e, 'to_bytes'):
-            e_bytes = e.to_bytes((e.bit_length() + 7) // 8, 'big')
-        else:
-            e_bytes = str(e).encode('utf-8')
+    @staticmethod
+    def to_bytes(e):
+        if type(e) is int:
+            return encode_value(e)
+        elif isinstance(e, (bytes, memoryview)):
+            if len(e) > VALUE_SIZE and e[:VALUE_SIZE] == CuckooFilter.EMPTY_VALUE:
+                return encode_value(int.from_bytes(e, 'big'))
+            return e
+        elif hasattr(e, 'to_bytes'):
+            return encode_value(int(e))
+
+        return str(e).encode('utf-8')
 
-        fp_val = self.to_int_hash(e_bytes, salt=b"fp_salt_")
-        fp = fp_val & self.fp_mask
+    @staticmethod
+    def mix_fps(fps):
+        z = np.asarray(fps, dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
 
-        fp = fp if fp != 0 else 1
+        return z ^ (z >> np.uint64(31))
 
-        idx1 = self.to_int_hash(e_bytes, salt=b"idx1_salt_") % self.n_buckets
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def gen_alt_table(n_buckets, fp_size):
+        return (CuckooFilter.mix_fps(np.arange(1 << fp_size)) % np.uint64(n_buckets)).astype(np.int64)
+
+    def alt_hash(self, fps):
+        if self.alt_table is not None:
+            return self.alt_table[fps]
 
-        fp_bytes = int(fp).to_bytes((self.fp_size + 7) // 8, 'big')
-        fp_hash = self.to_int_hash(fp_bytes, salt=b"idx2_salt_")
-        idx2 = (idx1 ^ fp_hash) % self.n_buckets
+        return (self.mix_fps(fps) % np.uint64(self.n_buckets)).astype(np.int64)
+
+    def get_fp_and_indices(self, e):
+        digest = hashlib.sha256(self.to_bytes(e)).digest()
+
+        fp = int.from_bytes(digest[:8], 'big') & self.fp_mask
+        fp = fp if fp != 0 else 1
+
+        idx1 = int.from_bytes(digest[8:16], 'big') % self.n_buckets
+        idx2 = self.get_alter_idx(idx1, fp)
 
         return fp, idx1, idx2
 
     def get_alter_idx(self, idx, fp):
-        fp_bytes = int(fp).to_bytes((self.fp_size + 7) // 8, 'big')
-        fp_hash = self.to_int_hash(fp_bytes, salt=b"idx2_salt_")
+        if self.alt_table is not None:
+            return (int(self.alt_table[fp]) - idx) % self.n_buckets
 
-        return (idx ^ fp_hash) % self.n_buckets
+        return (int(self.alt_hash(np.array([fp]))[0]) - idx) % self.n_buckets
 
-    def ins(self, e):
-        fp, idx1, idx2 = self.get_fp_and_indices(e)
-        return fp, idx1, idx2
+    @staticmethod
+    def digest_many(items):
+        sha256, to_bytes = hashlib.sha256, CuckooFilter.to_bytes
+        digests = b''.join([sha256(to_bytes(e)).digest()[:16] for e in items])
 
-    def ert(self, vals):
-        fp, idx1, idx2 = vals
+        return np.frombuffer(digests, dtype='>u8').reshape(-1, 2)
 
-        free_slot1 = np.where(self.buckets[idx1] == 0)[0]
-        if len(free_slot1) > 0:
-            self.buckets[idx1, free_slot1[0]] = fp
-            self.n_items += 1
-            return True
+    def hash_many(self, items):
+        return self.hash_words(self.digest_many(items))
 
-        free_slot2 = np.where(self.buckets[idx2] == 0)[0]
-        if len(free_slot2) > 0:
-            self.buckets[idx2, free_slot2[0]] = fp
-            self.n_items += 1
-            return True
+    def hash_words(self, words):
+        fps = (words[:, 0] & self.fp_mask).astype(self.buckets.dtype)
+        fps[fps == 0] = 1
+
+        idx1 = (words[:, 1] % self.n_buckets).astype(np.int64)
+        idx2 = (self.alt_hash(fps) - idx1) % self.n_buckets
+
+        return fps, idx1, idx2
+
+    def place_many(self, fps, idxs):
+        order = np.argsort(idxs, kind='stable')
+        s_idxs = idxs[order]
 
+        pos = np.arange(len(s_idxs))
+        is_first = np.ones(len(s_idxs), dtype=bool)
+        is_first[1:] = s_idxs[1:] != s_idxs[:-1]
+        rank = pos - np.maximum.accumulate(np.where(is_first, pos, 0))
+
+        rows = self.buckets[s_idxs]
+        is_free = rank < (rows == 0).sum(axis=1)
+
+        free_slots = np.argsort(rows != 0, axis=1, kind='stable')
+        slots = free_slots[pos, np.minimum(rank, self.bucket_size - 1)]
+
+        self.buckets[s_idxs[is_free], slots[is_free]] = fps[order[is_free]]
+
+        placed = np.zeros(len(idxs), dtype=bool)
+        placed[order[is_free]] = True
+
+        return placed
+
+    def kick(self, fp, idx1, idx2):
         f = fp
         bucket_idx = random.choice([idx1, idx2])
+        path = []
 
         for _ in range(self.max_kicks):
             kicked_slot = secrets.choice(range(self.bucket_size))
+            path.append((bucket_idx, kicked_slot, self.buckets[bucket_idx, kicked_slot]))
+            self.n_kicks += 1
+
             f, self.buckets[bucket_idx, kicked_slot] = self.buckets[bucket_idx, kicked_slot], f
-            bucket_idx = self.get_alter_idx(bucket_idx, f)
+            bucket_idx = self.get_alter_idx(bucket_idx, int(f))
 
             free_slots = np.where(self.buckets[bucket_idx] == 0)[0]
             if len(free_slots) > 0:
@@ -176,58 +635,91 @@ class CuckooFilter:
                 self.n_items += 1
                 return True
 
+        for bucket_idx, kicked_slot, f in reversed(path):
+            self.buckets[bucket_idx, kicked_slot] = f
+        self.n_failed += 1
+
         return False
 
-    def insert(self, e):
+    def ins(self, e):
         fp, idx1, idx2 = self.get_fp_and_indices(e)
+        return fp, idx1, idx2
+
+    def ert(self, vals):
+        fp, idx1, idx2 = vals
 
-        if np.any(self.buckets[idx1] == 0):
-            free_slot = np.where(self.buckets[idx1] == 0)[0][0]
-            self.buckets[idx1, free_slot] = fp
+        free_slot1 = np.where(self.buckets[idx1] == 0)[0]
+        if len(free_slot1) > 0:
+            self.buckets[idx1, free_slot1[0]] = fp
             self.n_items += 1
             return True
 
-        if np.any(self.buckets[idx2] == 0):
-            free_slot = np.where(self.buckets[idx2] == 0)[0][0]
-            self.buckets[idx2, free_slot] = fp
+        free_slot2 = np.where(self.buckets[idx2] == 0)[0]
+        if len(free_slot2) > 0:
+            self.buckets[idx2, free_slot2[0]] = fp
             self.n_items += 1
             return True
 
-        f = fp
-        bucket_idx = random.choice([idx1, idx2])
+        return self.kick(fp, idx1, idx2)
 
-        for _ in range(self.max_kicks):
-            kicked_slot = secrets.choice(range(self.bucket_size))
-            f, self.buckets[bucket_idx, kicked_slot] = self.buckets[bucket_idx, kicked_slot], f
-            bucket_idx = self.get_alter_idx(bucket_idx, f)
+    def insert(self, e):
+        return self.ert(self.get_fp_and_indices(e))
 
-            if np.any(self.buckets[bucket_idx] == 0):
-                free_slot = np.where(self.buckets[bucket_idx] == 0)[0][0]
-                self.buckets[bucket_idx, free_slot] = f
-                self.n_items += 1
-                return True
+    def insert_many(self, items):
+        return self.insert_words(self.digest_many(items))
 
-        return False
+    def insert_words(self, words, max_failed=None):
+        fps, idx1, idx2 = self.hash_words(words)
+
+        inserted = self.place_many(fps, idx1)
+
+        rest = np.flatnonzero(~inserted)
+        inserted[rest[self.place_many(fps[rest], idx2[rest])]] = True
+
+        self.n_items += int(inserted.sum())
+
+        n_failed = 0
+        for i in np.flatnonzero(~inserted):
+            inserted[i] = self.kick(fps[i], int(idx1[i]), int(idx2[i]))
+
+            n_failed += not inserted[i]
+            if n_failed == max_failed:
+                break
+
+        return inserted
 
     def delete(self, items):
-        count = 0
+        return self.delete_many(items)
 
-        for e in items:
-            fp, idx1, idx2 = self.get_fp_and_indices(e)
+    def delete_many(self, items):
+        return self.delete_words(self.digest_many(items))
 
-            for i in range(self.bucket_size):
-                if self.buckets[idx1, i] == fp:
-                    self.buckets[idx1, i] = 0
-                    self.n_items -= 1
-                    count += 1
+    def delete_words(self, words):
+        fps, idx1, idx2 = self.hash_words(words)
+        lo, hi = np.minimum(idx1, idx2), np.maximum(idx1, idx2)
 
-            for i in range(self.bucket_size):
-                if self.buckets[idx2, i] == fp:
-                    self.buckets[idx2, i] = 0
-                    self.n_items -= 1
-                    count += 1
+        # items with the same fingerprint and bucket pair are interchangeable: the r-th of them clears the r-th match
+        order = np.lexsort((fps, hi, lo))
+        s_lo, s_hi, s_fps = lo[order], hi[order], fps[order]
 
-        return count
+        pos = np.arange(len(order))
+        is_first = np.ones(len(order), dtype=bool)
+        is_first[1:] = (s_lo[1:] != s_lo[:-1]) | (s_hi[1:] != s_hi[:-1]) | (s_fps[1:] != s_fps[:-1])
+
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = pos - np.maximum.accumulate(np.where(is_first, pos, 0))
+
+        matches = np.concatenate((self.buckets[lo] == fps[:, None],
+                                  (self.buckets[hi] == fps[:, None]) & (hi != lo)[:, None]), axis=1)
+        rows, cols = np.nonzero(matches & (np.cumsum(matches, axis=1) == rank[:, None] + 1))
+
+        self.buckets[np.where(cols < self.bucket_size, lo[rows], hi[rows]), cols % self.bucket_size] = 0
+        self.n_items -= len(rows)
+
+        deleted = np.zeros(len(words), dtype=bool)
+        deleted[rows] = True
+
+        return deleted
 
     def seek(self, e):
         fp, idx1, idx2 = self.get_fp_and_indices(e)
@@ -236,3 +728,261 @@ class CuckooFilter:
             return True
 
         return False
+
+    def contains_many(self, items):
+        return self.contains_words(self.digest_many(items))
+
+    def contains_words(self, words):
+        fps, idx1, idx2 = self.hash_words(words)
+        fps = fps[:, None]
+
+        return (self.buckets[idx1] == fps).any(axis=1) | (self.buckets[idx2] == fps).any(axis=1)
+
+
+class DynamicCuckooFilter:
+    def __init__(self, capacity, bucket_size=4, max_kicks=100, load=0.9, fp_size=12):
+        self.bucket_size = bucket_size
+        self.max_kicks = max_kicks
+        self.load = load
+        self.fp_size = fp_size
+
+        self.blocks = [CuckooFilter(capacity, bucket_size, max_kicks, fp_size=fp_size)]
+
+    @property
+    def n_bytes(self):
+        return sum(block.n_bytes for block in self.blocks)
+
+    @property
+    def n_items(self):
+        return sum(block.n_items for block in self.blocks)
+
+    @property
+    def load_factor(self):
+        return self.n_items / sum(block.buckets.size for block in self.blocks)
+
+    @property
+    def fp_rate(self):
+        return sum(block.fp_rate for block in self.blocks)
+
+    def stats(self):
+        return {"n_items": self.n_items, "n_blocks": len(self.blocks), "load_factor": self.load_factor,
+                "n_kicks": sum(block.n_kicks for block in self.blocks),
+                "n_failed": sum(block.n_failed for block in self.blocks), "n_bytes": self.n_bytes}
+
+    def grow(self, n_items):
+        # sized for the items still waiting, the floor keeps single overflows from chaining tiny blocks
+        n_buckets = max(math.ceil(n_items / (self.bucket_size * self.load)), self.blocks[0].n_buckets // 16, 1)
+        block = CuckooFilter(n_buckets, self.bucket_size, self.max_kicks, fp_size=self.fp_size)
+        self.blocks.append(block)
+
+        return block
+
+    def insert(self, e):
+        if self.blocks[-1].insert(e):
+            return True
+
+        return self.grow(1).insert(e)
+
+    def insert_many(self, items):
+        return self.insert_words(CuckooFilter.digest_many(items))
+
+    def insert_words(self, words):
+        inserted = self.blocks[-1].insert_words(words, max_failed=1)
+        rest = np.flatnonzero(~inserted)
+
+        while len(rest) > 0:
+            block_inserted = self.grow(len(rest)).insert_words(words[rest], max_failed=1)
+            inserted[rest[block_inserted]] = True
+            rest = rest[~block_inserted]
+
+        return inserted
+
+    def delete(self, items):
+        return self.delete_many(items)
+
+    def delete_many(self, items):
+        return self.delete_words(CuckooFilter.digest_many(items))
+
+    def delete_words(self, words):
+        deleted = np.zeros(len(words), dtype=bool)
+        rest = np.arange(len(words))
+
+        for block in self.blocks:
+            block_deleted = block.delete_words(words[rest])
+            deleted[rest[block_deleted]] = True
+            rest = rest[~block_deleted]
+
+        return deleted
+
+    def seek(self, e):
+        return any(block.seek(e) for block in self.blocks)
+
+    def contains_many(self, items):
+        return self.contains_words(CuckooFilter.digest_many(items))
+
+    def contains_words(self, words):
+        found = np.zeros(len(words), dtype=bool)
+
+        for block in self.blocks:
+            found |= block.contains_words(words)
+
+        return found
+
+
+SHARD_VIEWS = {}
+
+
+def shard_worker(args):
+    shm_name, shape, shard_idx, max_kicks, fp_size, op, words = args
+
+    if shm_name not in SHARD_VIEWS:
+        # a worker forked before the owner registered the segment gets its own tracker,
+        # which would unlink the segment when the worker exits
+        own_tracker = resource_tracker._resource_tracker._fd is None
+
+        shm = shared_memory.SharedMemory(name=shm_name)
+        if own_tracker:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        SHARD_VIEWS[shm_name] = (shm, np.ndarray(shape, dtype=CuckooFilter.fp_dtype(fp_size), buffer=shm.buf))
+
+    shard = CuckooFilter(shape[1], shape[2], max_kicks, buckets=SHARD_VIEWS[shm_name][1][shard_idx], fp_size=fp_size)
+    result = getattr(shard, op)(words)
+
+    return result, shard.n_items, shard.n_kicks, shard.n_failed
+
+
+class ShardedCuckooFilter:
+    def __init__(self, capacity, n_shards=16, bucket_size=4, max_kicks=100, pool=None, min_parallel=4096, fp_size=12):
+        self.n_shards = n_shards
+        self.bucket_size = bucket_size
+        self.max_kicks = max_kicks
+        self.pool = pool
+        self.min_parallel = min_parallel
+        self.fp_size = fp_size
+
+        dtype = CuckooFilter.fp_dtype(fp_size)
+        self.shape = (n_shards, -(-capacity // n_shards), bucket_size)
+        n_bytes = int(np.prod(self.shape)) * np.dtype(dtype).itemsize
+
+        self.shm = shared_memory.SharedMemory(create=True, size=n_bytes)
+        self.finalizer = weakref.finalize(self, ShardedCuckooFilter.release, self.shm)
+
+        self.buckets = np.ndarray(self.shape, dtype=dtype, buffer=self.shm.buf)
+        self.buckets.fill(0)
+
+        self.shards = [CuckooFilter(self.shape[1], bucket_size, max_kicks, buckets=self.buckets[i], fp_size=fp_size)
+                       for i in range(n_shards)]
+
+    @staticmethod
+    def release(shm):
+        shm.close()
+        shm.unlink()
+
+    def close(self):
+        self.buckets = None
+        self.shards = []
+        self.finalizer()
+
+    @property
+    def n_bytes(self):
+        return self.buckets.nbytes
+
+    @property
+    def n_items(self):
+        return sum(shard.n_items for shard in self.shards)
+
+    @property
+    def load_factor(self):
+        return self.n_items / self.buckets.size
+
+    @property
+    def fp_rate(self):
+        return sum(shard.fp_rate for shard in self.shards) / self.n_shards
+
+    def stats(self):
+        return {"n_items": self.n_items, "n_blocks": self.n_shards, "load_factor": self.load_factor,
+                "n_kicks": sum(shard.n_kicks for shard in self.shards),
+                "n_failed": sum(shard.n_failed for shard in self.shards), "n_bytes": self.n_bytes}
+
+    def digest_many(self, items):
+        items = list(items)
+
+        if self.pool is None or len(items) < self.min_parallel:
+            return CuckooFilter.digest_many(items)
+
+        # mmap'd store records arrive as memoryviews, which cannot be pickled to the workers
+        items = [bytes(e) if isinstance(e, memoryview) else e for e in items]
+
+        chunk_size = -(-len(items) // (4 * len(self.shards)))
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+        return np.concatenate(self.pool.map(CuckooFilter.digest_many, chunks))
+
+    def dispatch(self, op, words):
+        shard_ids = (words[:, 0] >> np.uint64(32)) % np.uint64(self.n_shards)
+        order = np.argsort(shard_ids, kind='stable')
+        bounds = np.searchsorted(shard_ids[order], np.arange(self.n_shards + 1))
+
+        tasks = [(shard_idx, order[bounds[shard_idx]:bounds[shard_idx + 1]])
+                 for shard_idx in range(self.n_shards) if bounds[shard_idx] < bounds[shard_idx + 1]]
+
+        if self.pool is None or len(words) < self.min_parallel:
+            return [(pos, getattr(self.shards[shard_idx], op)(words[pos])) for shard_idx, pos in tasks]
+
+        results = self.pool.map(shard_worker, [(self.shm.name, self.shape, shard_idx, self.max_kicks, self.fp_size,
+                                                op, words[pos]) for shard_idx, pos in tasks])
+
+        for (shard_idx, _), (_, n_items, n_kicks, n_failed) in zip(tasks, results):
+            shard = self.shards[shard_idx]
+            shard.n_items += n_items
+            shard.n_kicks += n_kicks
+            shard.n_failed += n_failed
+
+        return [(pos, result) for (_, pos), (result, _, _, _) in zip(tasks, results)]
+
+    def insert(self, e):
+        return bool(self.insert_many([e])[0])
+
+    def insert_many(self, items):
+        return self.insert_words(self.digest_many(items))
+
+    def insert_words(self, words):
+        inserted = np.zeros(len(words), dtype=bool)
+
+        for pos, result in self.dispatch("insert_words", words):
+            inserted[pos] = result
+
+        # shards cannot grow, a dropped element would only surface later as a failed psi check
+        if not inserted.all():
+            raise RuntimeError(f"{int((~inserted).sum())} of {len(words)} items did not fit in the sharded "
+                               f"cuckoo filter (load {self.load_factor:.2f}), lower --cf_load")
+
+        return inserted
+
+    def delete(self, items):
+        return self.delete_many(items)
+
+    def delete_many(self, items):
+        return self.delete_words(self.digest_many(items))
+
+    def delete_words(self, words):
+        deleted = np.zeros(len(words), dtype=bool)
+
+        for pos, result in self.dispatch("delete_words", words):
+            deleted[pos] = result
+
+        return deleted
+
+    def seek(self, e):
+        return bool(self.contains_many([e])[0])
+
+    def contains_many(self, items):
+        return self.contains_words(self.digest_many(items))
+
+    def contains_words(self, words):
+        found = np.zeros(len(words), dtype=bool)
+
+        for pos, result in self.dispatch("contains_words", words):
+            found[pos] = result
+
+        return found
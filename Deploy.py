@@ -0,0 +1,394 @@
+import asyncio
+import Config
+import math
+import numpy as np
+import os
+import pickle
+import struct
+import tempfile
+import time
+from AA_MHT import AA_MHT
+from Codec import encode_element
+from concurrent.futures import ProcessPoolExecutor
+from Crypto import BlindingPool, CuckooFilter, EllipticCurveUtils, HomomorphicBLS, rsa_sign
+from Graph_Ops import mapping_function_psi
+from Logic_Check import blinding, fresh_items, next_update, sign_epoch, sign_worker, split_chunks
+from multiprocessing import get_context
+
+
+FRAME = struct.Struct('>I')
+
+
+async def send_msg(writer, msg):
+    buf = pickle.dumps(msg, protocol=pickle.HIGHEST_PROTOCOL)
+    writer.write(FRAME.pack(len(buf)) + buf)
+    await writer.drain()
+
+
+async def recv_msg(reader):
+    (length,) = FRAME.unpack(await reader.readexactly(FRAME.size))
+    return pickle.loads(await reader.readexactly(length))
+
+
+async def request(reader, writer, msg):
+    await send_msg(writer, msg)
+    return await recv_msg(reader)
+
+
+async def connect(address):
+    if isinstance(address, str):
+        return await asyncio.open_unix_connection(address)
+
+    return await asyncio.open_connection(*address)
+
+# ------------------------------------------------------------
+# ------------------------------------------------------------
+
+class CloudServer:
+    def __init__(self, cs_tree, cf, rsa_keys, cur_sig, cur_ts, proof_mode="single", n_workers=0, chunk_size=1024):
+        self.cs_tree = cs_tree
+        self.cf = cf
+        self.rsa_keys = rsa_keys
+        self.cur_sig = cur_sig
+        self.cur_ts = cur_ts
+        self.proof_mode = proof_mode
+        self.n_workers = n_workers
+        self.chunk_size = chunk_size
+
+        self.executor = None
+        self.stopped = None
+
+        # filter changes per epoch, shipped to the rps so they can probe their own replica
+        self.deltas = []
+
+        self.n_epochs = 0
+        self.n_queries = 0
+
+    async def rsa_map(self, vals):
+        if self.executor is None or len(vals) <= self.chunk_size:
+            return [rsa_sign(val, self.rsa_keys) for val in vals]
+
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(loop.run_in_executor(self.executor, sign_worker, (chunk, self.rsa_keys))
+                                         for chunk in split_chunks(vals, self.chunk_size)))
+
+        return [resp for resps, _ in results for resp in resps]
+
+    async def on_epoch(self, msg):
+        update_items, s_items = msg["update_items"], msg["s_items"]
+
+        enc_update = await self.rsa_map([EllipticCurveUtils.data_2_scalar(e) for e in msg["cf_items"]])
+        enc_s = await self.rsa_map([EllipticCurveUtils.data_2_scalar(e) for e in s_items])
+
+        if msg["update_type"] == "Addition":
+            insert_words = CuckooFilter.digest_many(enc_update + enc_s)
+            delete_words = CuckooFilter.digest_many([])
+        else:
+            insert_words = CuckooFilter.digest_many(enc_s)
+            delete_words = CuckooFilter.digest_many(enc_update)
+
+        # no await below: queries never see a root the filter deltas have not caught up with
+        self.cur_sig = HomomorphicBLS.aggregate(self.cur_sig, msg["delta_sigma"])
+
+        if msg["update_type"] == "Addition":
+            self.cs_tree.addition(update_items)
+        else:
+            self.cs_tree.deletion(update_items)
+
+        self.cf.insert_words(insert_words)
+        if len(delete_words):
+            self.cf.delete_words(delete_words)
+
+        self.deltas.append((insert_words, delete_words))
+        self.cs_tree.addition(s_items)
+        self.cur_ts = msg["update_ts"]
+        self.n_epochs += 1
+
+        return {"ts": self.cur_ts}
+
+    async def on_query(self, msg):
+        rq = msg["rq"]
+
+        if self.proof_mode == "packed":
+            vo = self.cs_tree.encode_vo([self.cs_tree.get_packed_proof(e) for e in rq])
+        elif self.proof_mode == "multi":
+            vo = self.cs_tree.get_multiproof(rq)
+        else:
+            vo = [self.cs_tree.get_proof(e) for e in rq]
+
+        self.n_queries += 1
+
+        return {"vo": vo, "sig": self.cur_sig, "ts": self.cur_ts, "deltas": self.deltas[msg["n_epochs"]:]}
+
+    async def on_sign(self, msg):
+        return {"resps": await self.rsa_map(msg["blinded"])}
+
+    async def on_shutdown(self, msg):
+        self.stopped.set()
+
+        return {"n_epochs": self.n_epochs, "n_queries": self.n_queries, "cf": self.cf.stats()}
+
+    async def handle(self, reader, writer):
+        try:
+            while not self.stopped.is_set():
+                msg = await recv_msg(reader)
+                await send_msg(writer, await getattr(self, "on_" + msg["op"])(msg))
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, address, ready):
+        self.stopped = asyncio.Event()
+
+        if isinstance(address, str):
+            server = await asyncio.start_unix_server(self.handle, path=address)
+        else:
+            server = await asyncio.start_server(self.handle, *address)
+            address = server.sockets[0].getsockname()[:2]
+
+        if self.n_workers:
+            self.executor = ProcessPoolExecutor(self.n_workers)
+
+        ready.put(address)
+
+        try:
+            async with server:
+                await self.stopped.wait()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+
+# ------------------------------------------------------------
+# ------------------------------------------------------------
+
+class FilterReplica:
+    def __init__(self, cf):
+        self.cf = cf
+        self.n_epochs = 0
+
+    def sync(self, deltas):
+        for insert_words, delete_words in deltas:
+            self.cf.insert_words(insert_words)
+            if len(delete_words):
+                self.cf.delete_words(delete_words)
+
+        self.n_epochs += len(deltas)
+
+    def probe(self, aug_words, q_words):
+        if not self.cf.contains_words(aug_words).all():
+            return False
+
+        # with the augmented set taken out, only false positives can still hit q
+        self.cf.delete_words(aug_words)
+        q_hits = int(self.cf.contains_words(q_words).sum())
+        self.cf.insert_words(aug_words)
+
+        fp_threshold = math.ceil(len(q_words) * self.cf.fp_rate * 3.0) + 3
+
+        return q_hits <= fp_threshold
+
+
+def verify_vo(rq, vo, signature, ts, bls_pk, proof_mode="single"):
+    if not rq:
+        return True
+
+    if proof_mode == "packed":
+        bufs = AA_MHT.decode_vo(vo)
+
+        if len(bufs) != len(rq) or not all(AA_MHT.verify_packed(e, buf) for e, buf in zip(rq, bufs)):
+            return False
+
+        root = AA_MHT.packed_root(bufs[0])
+    elif proof_mode == "multi":
+        if AA_MHT.compute_aa_multiroot(vo) != vo["merkle_root"]:
+            return False
+
+        root = int(vo["merkle_root"], 16)
+    else:
+        if len(vo) != len(rq) or not all(AA_MHT.compute_aa_root(proof) == proof["merkle_root"] for proof in vo):
+            return False
+
+        root = int(vo[0]["merkle_root"], 16)
+
+    return HomomorphicBLS.verify(bls_pk, ts, root, signature)
+
+
+async def run_query(reader, writer, replica, q_list, bls_pk, N, E, proof_mode, blind_pool=None):
+    reply = await request(reader, writer, {"op": "query", "rq": q_list, "n_epochs": replica.n_epochs})
+    replica.sync(reply["deltas"])
+
+    if not verify_vo(q_list, reply["vo"], reply["sig"], reply["ts"], bls_pk, proof_mode):
+        return False
+
+    s_nodes, s_edges = mapping_function_psi(reply["ts"], Config.TIMESTAMP_SIZE)
+    aug_rq = list(s_nodes | s_edges) + q_list
+
+    blinded, r_invs = blinding(aug_rq + q_list, N, E, blind_pool)
+    reply = await request(reader, writer, {"op": "sign", "blinded": blinded})
+
+    words = CuckooFilter.digest_many([(resp * r_inv) % N for resp, r_inv in zip(reply["resps"], r_invs)])
+
+    return replica.probe(words[:len(aug_rq)], words[len(aug_rq):])
+
+
+async def data_owner(address, bls_sk, g_nodes, g_edges, update_batches, q_nodes, q_edges, cur_ts, results):
+    reader, writer = await connect(address)
+
+    latencies = []
+    t_sign = 0
+
+    start_time = time.perf_counter()
+    for i in range(Config.N_ROUNDS):
+        round_idx = i + 1
+
+        update_type, update_nodes, update_edges, update_ts = next_update(g_nodes, g_edges, update_batches, round_idx,
+                                                                         q_nodes, q_edges)
+
+        s_nodes, s_edges = mapping_function_psi(update_ts, Config.TIMESTAMP_SIZE)
+
+        update_items = sorted(list(update_nodes) + list(update_edges), key=encode_element)
+        s_items = sorted(list(s_nodes | s_edges), key=encode_element)
+
+        sign_time = time.perf_counter()
+        delta_sigma = sign_epoch(bls_sk, cur_ts, update_ts, update_type, update_items, s_items)
+        t_sign += time.perf_counter() - sign_time
+
+        if update_type == "Addition":
+            cf_items = fresh_items(update_items, g_nodes, g_edges)
+        else:
+            cf_items = update_items
+
+        send_time = time.perf_counter()
+        await request(reader, writer, {"op": "epoch", "update_type": update_type, "update_items": update_items,
+                                       "cf_items": cf_items, "s_items": s_items, "update_ts": update_ts,
+                                       "delta_sigma": delta_sigma})
+        latencies.append(time.perf_counter() - send_time)
+
+        if update_type == "Addition":
+            g_nodes |= update_nodes
+            g_edges |= update_edges
+        else:
+            g_nodes -= update_nodes
+            g_edges -= update_edges
+
+        cur_ts = update_ts
+
+    results.put(("DO", latencies, t_sign, start_time, time.perf_counter()))
+
+    writer.close()
+
+
+async def requesting_party(address, cf, q_list, bls_pk, N, E, results):
+    reader, writer = await connect(address)
+    replica = FilterReplica(cf)
+
+    blind_pool = None
+    if Config.BLIND_POOL_SIZE:
+        blind_pool = BlindingPool(N, E, size=Config.BLIND_POOL_SIZE, background=False)
+
+    latencies = []
+    n_failed = 0
+
+    start_time = time.perf_counter()
+    for _ in range(Config.CLIENT_QUERIES):
+        query_time = time.perf_counter()
+        n_failed += not await run_query(reader, writer, replica, q_list, bls_pk, N, E, Config.PROOF_MODE, blind_pool)
+        latencies.append(time.perf_counter() - query_time)
+
+        if blind_pool is not None:
+            blind_pool.refill()
+
+    results.put(("RP", latencies, n_failed, start_time, time.perf_counter()))
+
+    writer.close()
+
+
+async def shutdown(address):
+    reader, writer = await connect(address)
+    stats = await request(reader, writer, {"op": "shutdown"})
+    writer.close()
+
+    return stats
+
+
+def run_actor(actor, *args):
+    asyncio.run(actor(*args))
+
+# ------------------------------------------------------------
+# ------------------------------------------------------------
+
+def percentiles(latencies):
+    return np.percentile(np.array(latencies) * 1000, [50, 99])
+
+
+def deploy(bls_keys, rsa_keys, g_nodes, g_edges, update_batches, q_nodes, q_edges, cs_tree, cf, init_sig, init_ts):
+    bls_sk, bls_pk = bls_keys
+    N, E = rsa_keys['N'], rsa_keys['E']
+
+    # actors inherit their state through fork, only the protocol messages cross the socket
+    ctx = get_context("fork")
+    ready, results = ctx.Queue(), ctx.Queue()
+
+    if Config.DEPLOY == "unix":
+        address = os.path.join(tempfile.gettempdir(), f"smfresh-{os.getpid()}.sock")
+    else:
+        address = ("127.0.0.1", 0)
+
+    server = CloudServer(cs_tree, cf, rsa_keys, init_sig, init_ts, Config.PROOF_MODE, Config.CS_WORKERS,
+                         Config.PSI_CHUNK)
+
+    cs = ctx.Process(target=run_actor, args=(server.serve, address, ready))
+    cs.start()
+    address = ready.get()
+
+    q_list = list(q_nodes | q_edges)
+
+    actors = [ctx.Process(target=run_actor, args=(data_owner, address, bls_sk, g_nodes, g_edges, update_batches,
+                                                  q_nodes, q_edges, init_ts, results))]
+    actors += [ctx.Process(target=run_actor, args=(requesting_party, address, cf, q_list, bls_pk, N, E, results))
+               for _ in range(Config.N_CLIENTS)]
+
+    for actor in actors:
+        actor.start()
+
+    reports = [results.get() for _ in actors]
+
+    for actor in actors:
+        actor.join()
+
+    stats = asyncio.run(shutdown(address))
+    cs.join()
+
+    if isinstance(address, str) and os.path.exists(address):
+        os.remove(address)
+
+    # ------------------------------------------------------------
+
+    _, do_latencies, t_sign, do_start, do_end = next(report for report in reports if report[0] == "DO")
+
+    if do_latencies:
+        p50, p99 = percentiles(do_latencies)
+        print(f"[RESULT] [DEPLOY DO] |epochs|={len(do_latencies)} "
+              f"throughput: {len(do_latencies) / (do_end - do_start):.2f} epochs/s "
+              f"sign: {t_sign * 1000 / len(do_latencies):.0f}ms/epoch "
+              f"apply p50: {p50:.0f}ms p99: {p99:.0f}ms")
+
+    rp_reports = [report for report in reports if report[0] == "RP"]
+    rp_latencies = [latency for report in rp_reports for latency in report[1]]
+    n_failed = sum(report[2] for report in rp_reports)
+
+    if rp_latencies:
+        wall = max(report[4] for report in rp_reports) - min(report[3] for report in rp_reports)
+        p50, p99 = percentiles(rp_latencies)
+
+        print(f"[RESULT] [DEPLOY RP] clients={len(rp_reports)} |queries|={len(rp_latencies)} failed={n_failed} "
+              f"throughput: {len(rp_latencies) / wall:.2f} queries/s "
+              f"latency p50: {p50:.0f}ms p99: {p99:.0f}ms max: {max(rp_latencies) * 1000:.0f}ms")
+
+    cf_stats = stats["cf"]
+    print(f"[INFO] CF: |S|={cf_stats['n_items']} blocks={cf_stats['n_blocks']} "
+          f"load={cf_stats['load_factor']:.2f} kicks={cf_stats['n_kicks']} failed={cf_stats['n_failed']} "
+          f"mem={cf_stats['n_bytes'] / 1024:.0f}KB")
+
+    return n_failed == 0
@@ -1,83 +1,172 @@
 import collections
 import hashlib
+import numpy as np
 import os
 import random
+import re
+import warnings
 from datetime import datetime
 
 
-def load_graph(file_path):
-    nodes_set, edges_set = set(), set()
+EDGE_CHUNK = 1 << 24
+COMMENT_LINE = re.compile(rb'^[#%].*\n?', re.M)
+
+
+def parse_lines(buf, line_idx):
+    rows = []
+
+    for line in buf.splitlines():
+        parts = line.split()
+        try:
+            if len(parts) >= 3:
+                rows.append((int(parts[0]), int(parts[1]), int(parts[2])))
+            elif len(parts) == 2:
+                rows.append((int(parts[0]), int(parts[1]), line_idx + len(rows)))
+        except ValueError:
+            continue
+
+    return np.array(rows, dtype=np.int64).reshape(-1, 3)
+
+
+def parse_chunk(buf, line_idx):
+    buf = COMMENT_LINE.sub(b'', buf)
+    n_cols = len(buf.split(b'\n', 1)[0].split())
+    n_lines = buf.count(b'\n')
+
+    if n_cols < 2 or n_lines == 0:
+        return parse_lines(buf, line_idx)
+
+    # a malformed token stops fromstring early with a warning, fall back to per-line parsing
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        try:
+            vals = np.fromstring(buf, dtype=np.int64, sep=' ')
+        except (DeprecationWarning, ValueError):
+            return parse_lines(buf, line_idx)
+
+    if len(vals) != n_lines * n_cols:
+        return parse_lines(buf, line_idx)
+
+    rows = vals.reshape(n_lines, n_cols)
+
+    if n_cols >= 3:
+        return rows[:, :3]
+
+    return np.column_stack((rows, np.arange(line_idx, line_idx + n_lines, dtype=np.int64)))
+
+
+def iter_edge_chunks(file_path, chunk_size=EDGE_CHUNK):
+    line_idx = 0
+    tail = b''
+
+    with open(file_path, 'rb') as file:
+        while True:
+            buf = file.read(chunk_size)
+            if not buf:
+                break
+
+            buf = tail + buf
+            cut = buf.rfind(b'\n') + 1
+            buf, tail = buf[:cut], buf[cut:]
+
+            rows = parse_chunk(buf, line_idx)
+            line_idx += len(rows)
+            yield rows
+
+    if tail.strip():
+        yield parse_chunk(tail + b'\n', line_idx)
+
+
+def canonical_edges(rows):
+    u = np.minimum(rows[:, 0], rows[:, 1])
+    v = np.maximum(rows[:, 0], rows[:, 1])
+    ts = rows[:, 2]
+
+    keep = u != v
+    u, v, ts = u[keep], v[keep], ts[keep]
+
+    if len(u) == 0:
+        return np.empty((0, 3), dtype=np.int64)
+
+    if u.min() >= 0 and v.max() < 1 << 32:
+        order = np.argsort((u.astype(np.uint64) << np.uint64(32)) | v.astype(np.uint64))
+    else:
+        order = np.lexsort((v, u))
+    u, v, ts = u[order], v[order], ts[order]
+
+    # keep the earliest timestamp of every repeated edge
+    starts = np.flatnonzero(np.r_[True, (u[1:] != u[:-1]) | (v[1:] != v[:-1])])
+    edges = np.column_stack((u[starts], v[starts], np.minimum.reduceat(ts, starts)))
+
+    return edges[np.argsort(edges[:, 2], kind='stable')]
+
+
+def edge_cache_path(file_path):
+    return f"{file_path}.edges.npy"
+
 
-    if os.path.exists(file_path):
-        with open(file_path, 'r') as file:
-            lines = file.readlines()
+def load_edges(file_path):
+    cache_path = edge_cache_path(file_path)
 
-        for line in lines:
-            if not line.startswith('#'):
-                parts = line.split()
+    if os.path.exists(cache_path) and (not os.path.exists(file_path) or
+                                       os.path.getmtime(cache_path) >= os.path.getmtime(file_path)):
+        return np.load(cache_path, mmap_mode='r')
 
-                if len(parts) >= 2:
-                    u, v = int(parts[0]), int(parts[1])
-                    nodes_set.add(u)
-                    nodes_set.add(v)
-                    edges_set.add(tuple(sorted((u, v))))
+    if not os.path.exists(file_path):
+        return np.empty((0, 3), dtype=np.int64)
+
+    chunks = list(iter_edge_chunks(file_path))
+    edges = canonical_edges(np.concatenate(chunks) if chunks else np.empty((0, 3), dtype=np.int64))
+
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, edges)
+    os.replace(tmp_path, cache_path)
+
+    return np.load(cache_path, mmap_mode='r')
+
+
+def edge_tuples(edges):
+    return list(zip(edges[:, 0].tolist(), edges[:, 1].tolist()))
+
+
+def load_graph(file_path):
+    edges = load_edges(file_path)
+
+    nodes = np.sort(edges[:, :2], axis=None)
+    nodes_set = set(nodes[np.r_[True, nodes[1:] != nodes[:-1]]].tolist()) if len(nodes) else set()
+    edges_set = set(edge_tuples(edges))
 
     return nodes_set, edges_set
 
 
-def adjacency_list(nodes, edges):
-    adj_list = collections.defaultdict(set)
+def csr_adjacency(edges):
+    ends = np.asarray(edges[:, :2])
 
-    for u, v in edges:
-        adj_list[u].add(v)
-        adj_list[v].add(u)
+    nodes = np.sort(ends, axis=None)
+    nodes = nodes[np.r_[True, nodes[1:] != nodes[:-1]]] if len(nodes) else nodes
 
-    for node in nodes:
-        if node not in adj_list:
-            adj_list[node] = set()
+    u = np.searchsorted(nodes, ends[:, 0])
+    v = np.searchsorted(nodes, ends[:, 1])
+
+    src = np.concatenate((u, v))
+    dst = np.concatenate((v, u))
+
+    offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=len(nodes)), out=offsets[1:])
+
+    return nodes, offsets, dst[np.argsort(src, kind='stable')]
 
-    return adj_list
 
 # ------------------------------------------------------------
 # ------------------------------------------------------------
 
 def load_stream(file_path, initial_ratio, batch_size):
-    ts_edges = []
-    line_idx = 0
+    sorted_edges = edge_tuples(load_edges(file_path))
 
-    if os.path.exists(file_path):
-        with open(file_path, 'r') as file:
-            for line in file:
-                if line.startswith('#') or line.startswith('%'):
-                    continue
-                parts = line.split()
-                try:
-                    if len(parts) >= 3:
-                        u, v, ts = int(parts[0]), int(parts[1]), int(parts[2])
-                    elif len(parts) == 2:
-                        u, v = int(parts[0]), int(parts[1])
-                        ts = line_idx
-                    else:
-                        continue
-
-                    if u != v:
-                        ts_edges.append((ts, tuple(sorted((u, v)))))
-
-                    line_idx += 1
-                except ValueError:
-                    continue
-    else:
+    if not sorted_edges:
         return set(), set(), []
 
-    edge_2_ts = {}
-    for ts, edge in ts_edges:
-        if edge not in edge_2_ts:
-            edge_2_ts[edge] = ts
-        else:
-            edge_2_ts[edge] = min(edge_2_ts[edge], ts)
-
-    sorted_edges = sorted([(ts, edge) for edge, ts in edge_2_ts.items()])
-    sorted_edges = [edge for ts, edge in sorted_edges]
     n_edges = len(sorted_edges)
 
     init_size = int(n_edges * initial_ratio)
@@ -97,50 +186,87 @@ def load_stream(file_path, initial_ratio, batch_size):
     return nodes_set, edges_set, update_batches
 
 
-def sample_graph(adj_list, n_samples, locked_nodes, locked_edges):
-    fixed_nodes = locked_nodes.copy()
+def sample_graph(csr, n_samples, locked_nodes, locked_edges, n_probes=4):
+    nodes, offsets, neighbors = csr
+
+    fixed_nodes = set(locked_nodes)
 
     for u, v in locked_edges:
         fixed_nodes.add(u)
         fixed_nodes.add(v)
 
-    sampled_nodes = fixed_nodes.copy()
-    node_sequence = list(fixed_nodes)
+    visited = np.zeros(len(nodes), dtype=bool)
 
-    node_pool = list(adj_list.keys())
-    if not node_sequence:
-        if not node_pool:
-            return set(), set()
+    fixed_ids = np.array(sorted(fixed_nodes), dtype=np.int64)
+    fixed_idxs = np.searchsorted(nodes, fixed_ids[np.isin(fixed_ids, nodes)])
+    visited[fixed_idxs] = True
 
-        start_node = random.choice(node_pool)
-        sampled_nodes.add(start_node)
-        node_sequence.append(start_node)
+    n_sampled = len(fixed_nodes)
 
-    cur_node = node_sequence[-1]
+    # walk nodes that may still have unvisited neighbours
+    open_nodes = fixed_idxs.tolist()
+    if not open_nodes:
+        if not len(nodes):
+            return fixed_nodes, set(locked_edges)
 
-    while len(sampled_nodes) < n_samples:
-        adjacent_nodes = adj_list.get(cur_node, set())
+        start_node = random.randrange(len(nodes))
+        visited[start_node] = True
+        open_nodes.append(start_node)
+        n_sampled += 1
 
-        pending_nodes = [n for n in adjacent_nodes if n not in sampled_nodes]
+    pos = len(open_nodes) - 1
+    cur_node = open_nodes[pos]
 
-        if pending_nodes:
-            next_node = random.choice(pending_nodes)
-            sampled_nodes.add(next_node)
-            node_sequence.append(next_node)
-            cur_node = next_node
-        else:
-            cur_node = random.choice(node_sequence)
+    while n_sampled < n_samples:
+        lo, hi = int(offsets[cur_node]), int(offsets[cur_node + 1])
+        next_node = -1
 
-            if len(sampled_nodes) >= len(node_pool):
+        # rejection sampling is uniform over the unvisited neighbours, the scan bounds it on saturated hubs
+        for _ in range(min(n_probes, hi - lo)):
+            node = int(neighbors[random.randrange(lo, hi)])
+            if not visited[node]:
+                next_node = node
                 break
+        else:
+            adjacent_nodes = neighbors[lo:hi]
+            pending_nodes = adjacent_nodes[~visited[adjacent_nodes]]
+            if len(pending_nodes):
+                next_node = int(pending_nodes[random.randrange(len(pending_nodes))])
+
+        if next_node >= 0:
+            visited[next_node] = True
+            n_sampled += 1
+
+            open_nodes.append(next_node)
+            pos = len(open_nodes) - 1
+            cur_node = next_node
+            continue
+
+        open_nodes[pos] = open_nodes[-1]
+        open_nodes.pop()
+
+        if open_nodes:
+            pos = random.randrange(len(open_nodes))
+            cur_node = open_nodes[pos]
+            continue
+
+        # the walked components are exhausted, continue in another one
+        unvisited = np.flatnonzero(~visited)
+        if not len(unvisited):
+            break
+
+        cur_node = int(unvisited[random.randrange(len(unvisited))])
+        visited[cur_node] = True
+        n_sampled += 1
+
+        open_nodes.append(cur_node)
+        pos = 0
 
-    sampled_edges = locked_edges.copy()
+    src = np.repeat(np.arange(len(nodes)), np.diff(offsets))
+    mask = visited[src] & visited[neighbors] & (src < neighbors)
 
-    for u in sampled_nodes:
-        adjacent_nodes = adj_list.get(u, set())
-        for v in adjacent_nodes:
-            if v in sampled_nodes and u < v:
-                sampled_edges.add(tuple(sorted((u, v))))
+    sampled_nodes = fixed_nodes | set(nodes[visited].tolist())
+    sampled_edges = set(locked_edges) | set(zip(nodes[src[mask]].tolist(), nodes[neighbors[mask]].tolist()))
 
     return sampled_nodes, sampled_edges
 
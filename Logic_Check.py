@@ -1,12 +1,17 @@
 import Config
 import math
+import numpy as np
 import secrets
 import time
 from AA_MHT import AA_MHT, MHT
-from Crypto import CuckooFilter, EllipticCurveUtils, gen_rsa_keys, HomomorphicBLS
+from Codec import encode_element, value_width
+from collections import deque
+from Crypto import (BlindingPool, CuckooFilter, DynamicCuckooFilter, EllipticCurveUtils, gen_rsa_keys, HomomorphicBLS,
+                    rsa_crt_params, rsa_sign, ShardedCuckooFilter)
 from datetime import datetime
-from Graph_Ops import adjacency_list, gen_subgraph, load_graph, load_stream, mapping_function_psi, sample_graph
-from multiprocessing import cpu_count, Pool
+from Graph_Ops import (csr_adjacency, gen_subgraph, gen_update, load_edges, load_graph, load_stream,
+                       mapping_function_psi, sample_graph)
+from multiprocessing import cpu_count, get_context, Pool
 from py_ecc.optimized_bn128 import curve_order
 from sympy import mod_inverse
 from tqdm import tqdm
@@ -16,8 +21,7 @@ def Load_Graph(idx, init_ratio, batch_size, scale=None):
     file_path = Config.GDB_DIR + Config.GDB_NAMES[idx]
 
     if scale is not None:
-        raw_nodes, raw_edges = load_graph(file_path)
-        adj_list = adjacency_list(raw_nodes, raw_edges)
+        csr = csr_adjacency(load_edges(file_path))
 
         fixed_nodes = set()
         fixed_edges = set()
@@ -29,7 +33,7 @@ def Load_Graph(idx, init_ratio, batch_size, scale=None):
             fixed_nodes = set(instance[0])
             fixed_edges = {tuple(sorted(e)) for e in instance[1]}
 
-        nodes_set, edges_set = sample_graph(adj_list, scale, fixed_nodes, fixed_edges)
+        nodes_set, edges_set = sample_graph(csr, scale, fixed_nodes, fixed_edges)
 
         update_batches = []
 
@@ -39,8 +43,6 @@ def Load_Graph(idx, init_ratio, batch_size, scale=None):
         nodes_set, edges_set = load_graph(file_path)
         update_batches = []
 
-    edges_set = {tuple(sorted(e)) for e in edges_set}
-
     return nodes_set, edges_set, update_batches
 
 
@@ -60,6 +62,13 @@ def get_subgraph(edges_set, key):
 
     return set(), set()
 
+
+def get_subgraphs(edges_set, query_file):
+    with open(query_file) as f:
+        keys = [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+    return [get_subgraph(edges_set, key) for key in keys]
+
 # ------------------------------------------------------------
 # ------------------------------------------------------------
 
@@ -69,14 +78,24 @@ def init_key():
 
     if keys is None:
         bls_sk, bls_pk = HomomorphicBLS.gen_key()
-        N, E, D = gen_rsa_keys()
-        keys = {'N': N, 'E': E, 'D': D, 'BLS_SK': bls_sk, 'BLS_PK': bls_pk}
+        N, E, D, P, Q = gen_rsa_keys()
+        keys = {'N': N, 'E': E, 'D': D, 'P': P, 'Q': Q, 'BLS_SK': bls_sk, 'BLS_PK': bls_pk}
+        CM.save(keys, CM.key_path())
+
+    if 'CRT' not in keys:
+        keys['CRT'] = rsa_crt_params(keys['N'], keys['E'], keys['D'], keys.get('P'), keys.get('Q'))
+        CM.save(keys, CM.key_path())
+
+    if 'EC_TABLES' in keys:
+        EllipticCurveUtils.load_tables(keys['EC_TABLES'])
+    else:
+        keys['EC_TABLES'] = EllipticCurveUtils.dump_tables()
         CM.save(keys, CM.key_path())
 
     N, E, D = keys['N'], keys['E'], keys['D']
     bls_sk, bls_pk = keys.get('BLS_SK'), keys.get('BLS_PK')
 
-    rsa_keys = {'N': N, 'E': E, 'D': D}
+    rsa_keys = {'N': N, 'E': E, 'D': D, 'CRT': keys['CRT']}
 
     return (bls_sk, bls_pk), rsa_keys
 
@@ -85,58 +104,223 @@ def init_outsourcing(g_nodes_set, g_edges_set, bls_sk, ts_size):
     init_ts = datetime.now().strftime("%Y%m%d%H%M%S%f")
     s_nodes_set, s_edges_set = mapping_function_psi(init_ts, ts_size)
 
-    init_tree = MHT(sorted(list(g_nodes_set | g_edges_set | s_nodes_set | s_edges_set), key=lambda x: str(x)))
+    init_items = sorted(list(g_nodes_set | g_edges_set | s_nodes_set | s_edges_set), key=encode_element)
+
+    with Pool(cpu_count()) as p:
+        init_tree = MHT.build_parallel(init_items, p)
+
     init_root = int(init_tree.merkle_root, 16) % curve_order
     init_sig = HomomorphicBLS.sign_initial(bls_sk, init_ts, init_root)
 
-    cs_tree = AA_MHT(sorted(list(g_nodes_set | g_edges_set | s_nodes_set | s_edges_set), key=lambda x: str(x)))
+    cs_tree = AA_MHT(None, compact_threshold=Config.COMPACT_THRESHOLD, initial_tree=init_tree)
 
     return init_ts, init_sig, cs_tree, (s_nodes_set, s_edges_set)
 
+
+def next_update(g_nodes_set, g_edges_set, update_batches, round_idx, locked_nodes, locked_edges):
+    update_type = "Addition"
+    if update_batches and round_idx <= len(update_batches):
+        batch_edges = update_batches[round_idx - 1]
+        update_ts = datetime.now().strftime(f"%Y%m%d%H%M%S{round_idx}")
+    else:
+        if round_idx % 4 == 0:
+            update_type = "Deletion"
+
+        _, batch_edges, update_ts = gen_update(g_nodes_set, g_edges_set, Config.BATCH_SIZE, update_type,
+                                               locked_nodes=locked_nodes, locked_edges=locked_edges)
+
+    update_edges = {tuple(sorted(e)) for e in batch_edges}
+
+    if update_type == "Addition":
+        update_nodes = {node for edge in update_edges for node in edge}
+    else:
+        edge_pool = g_edges_set - update_edges
+        active_nodes = {node for edge in edge_pool for node in edge}
+        updated_nodes = {node for edge in update_edges for node in edge}
+        update_nodes = updated_nodes - active_nodes
+
+    return update_type, update_nodes, update_edges, update_ts
+
+
+def fresh_items(items, g_nodes_set, g_edges_set):
+    # the filter holds one copy per element, an addition batch also lists endpoints already in the graph
+    return [e for e in items if e not in (g_edges_set if isinstance(e, tuple) else g_nodes_set)]
+
+
+def sign_epoch(bls_sk, cur_ts, update_ts, update_type, update_items, s_items):
+    update_root = int(MHT(update_items).merkle_root, 16) % curve_order
+    s_root = int(MHT(s_items).merkle_root, 16) % curve_order
+
+    if update_type == "Addition":
+        delta_root = (update_root + s_root) % curve_order
+    else:
+        delta_root = (-update_root + s_root) % curve_order
+
+    return HomomorphicBLS.sign_update(bls_sk, cur_ts, update_ts, delta_root)
+
 # ------------------------------------------------------------
 # ------------------------------------------------------------
 
 def rsa_worker(args):
-    val, D, N = args
-    return pow(val, D, N)
+    val, rsa_keys = args
+    return rsa_sign(val, rsa_keys)
+
+
+def planned_items(g_nodes_set, update_batches):
+    n_items = 0
+    stream_nodes = set()
+
+    for round_idx in range(1, Config.N_ROUNDS + 1):
+        if update_batches and round_idx <= len(update_batches):
+            # stream edges are all new, their endpoints only count the first time they appear
+            batch = update_batches[round_idx - 1]
+            new_nodes = {node for edge in batch for node in edge if node not in g_nodes_set} - stream_nodes
+            stream_nodes |= new_nodes
+            n_items += len(batch) + len(new_nodes)
+        elif round_idx % 4:
+            # a generated edge brings exactly one new node
+            n_items += 2 * Config.BATCH_SIZE
+
+        # the psi set holds TIMESTAMP_SIZE edges over at most twice as many nodes
+        n_items += 3 * Config.TIMESTAMP_SIZE
+
+    return n_items
 
 
 def get_cf(g_nodes_set, g_edges_set, s_nodes_set, s_edges_set,
-           rsa_keys, idx, init_ratio, scale=None):
+           rsa_keys, idx, init_ratio, scale=None, pool=None, update_batches=None):
 
     n_items = len(g_nodes_set) + len(g_edges_set) + len(s_nodes_set) + len(s_edges_set)
-    capacity = math.ceil(n_items / 0.5)
+    bucket_size = 4
 
-    cf = CuckooFilter(capacity=capacity)
-    N, D = rsa_keys['N'], rsa_keys['D']
+    # room for everything the run will insert, so the filter ends near the target load instead of growing
+    n_items += planned_items(g_nodes_set, update_batches)
+    capacity = math.ceil(n_items / (bucket_size * Config.CF_LOAD))
+    max_kicks = CuckooFilter.max_kicks_for(Config.CF_LOAD)
+
+    if Config.CF_SHARDS:
+        cf = ShardedCuckooFilter(capacity=capacity, n_shards=Config.CF_SHARDS, bucket_size=bucket_size,
+                                 max_kicks=max_kicks, pool=pool, fp_size=Config.CF_FP_BITS)
+    else:
+        cf = DynamicCuckooFilter(capacity=capacity, bucket_size=bucket_size, max_kicks=max_kicks,
+                                 load=Config.CF_LOAD, fp_size=Config.CF_FP_BITS)
 
     CM = Config.CacheManager()
-    data_path = CM.data_path(idx, init_ratio, scale)
-    GDB = CM.load(data_path)
+    key_fp = CM.key_fingerprint(rsa_keys)
+    record_size = value_width(rsa_keys['N'].bit_length())
 
-    if GDB is None:
-        task_G = [(EllipticCurveUtils.data_2_scalar(e), D, N) for e in list(g_nodes_set) + list(g_edges_set)]
+    GDB = Config.EncStore(CM.data_path(idx, init_ratio, scale, key_fp), record_size, key_fp)
 
-        with Pool(cpu_count()) as p:
-            GDB = list(tqdm(p.imap(rsa_worker, task_G)))
-        CM.save(GDB, data_path)
+    if not GDB.exists():
+        task_G = [(EllipticCurveUtils.data_2_scalar(e), rsa_keys) for e in list(g_nodes_set) + list(g_edges_set)]
 
-    task_S = [(EllipticCurveUtils.data_2_scalar(e), D, N) for e in list(s_nodes_set) + list(s_edges_set)]
+        with Pool(cpu_count()) as p:
+            GDB.build(tqdm(p.imap(rsa_worker, task_G, chunksize=256), total=len(task_G)))
 
-    enc_s = [pow(val, D, N) for val, _, _ in task_S]
+    task_S = [EllipticCurveUtils.data_2_scalar(e) for e in list(s_nodes_set) + list(s_edges_set)]
 
-    for val in GDB:
-        cf.insert(val)
+    enc_s = [rsa_sign(val, rsa_keys) for val in task_S]
 
-    for val in enc_s:
-        cf.insert(val)
+    cf.insert_many(GDB.iter_records())
+    cf.insert_many(enc_s)
 
     return cf
 
+def get_stream_store(rsa_keys, idx, init_ratio, batch_size):
+    CM = Config.CacheManager()
+    key_fp = CM.key_fingerprint(rsa_keys)
+    record_size = value_width(rsa_keys['N'].bit_length())
+
+    # a file of its own, so appending never touches the cached initial graph
+    return Config.EncStore(CM.stream_path(idx, init_ratio, batch_size, key_fp), record_size, key_fp)
+
+
+def sign_stream_batch(store, offset, raw_update, rsa_keys, pool):
+    # replayed batches carry the same items on every run, so each is signed once and read back afterwards
+    if len(store) >= offset + len(raw_update):
+        return list(store.iter_records(offset, len(raw_update)))
+
+    enc_update = pool.map(rsa_worker, [(x, rsa_keys) for x in raw_update], chunksize=500)
+    store.append(enc_update, offset)
+
+    return enc_update
+
 # ------------------------------------------------------------
 # ------------------------------------------------------------
 
-def verify_integrity(vo, signature, ts, bls_pk):
+PROOF_SNAPSHOT = None
+PROOF_POOL = None
+PROOF_POOL_KEY = None
+
+
+def proof_worker(args):
+    proof_mode, elements = args
+
+    if proof_mode == "packed":
+        return [PROOF_SNAPSHOT.get_packed_proof(e) for e in elements]
+
+    return [PROOF_SNAPSHOT.get_proof(e) for e in elements]
+
+
+def verify_worker(args):
+    proof_mode, elements, proofs = args
+
+    if proof_mode == "packed":
+        return all(AA_MHT.verify_packed(e, buf) for e, buf in zip(elements, proofs))
+
+    return all(AA_MHT.compute_aa_root(proof) == proof["merkle_root"] for proof in proofs)
+
+
+def split_chunks(items, chunk_size):
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+def proof_pool(cs_tree, n_workers):
+    global PROOF_SNAPSHOT, PROOF_POOL, PROOF_POOL_KEY
+
+    # forked workers see the tree as of this epoch without pickling it, so re-fork only when its root changes
+    key = (id(cs_tree), cs_tree.merkle_root, n_workers)
+    if PROOF_POOL_KEY != key:
+        if PROOF_POOL is not None:
+            PROOF_POOL.terminate()
+
+        PROOF_SNAPSHOT = cs_tree
+        PROOF_POOL = get_context("fork").Pool(n_workers)
+        PROOF_SNAPSHOT = None
+        PROOF_POOL_KEY = key
+
+    return PROOF_POOL
+
+
+def parallel_proofs(rq, cs_tree, proof_mode, n_workers):
+    rq_list = list(rq)
+    chunk_size = -(-len(rq_list) // (4 * n_workers))
+    rq_chunks = split_chunks(rq_list, chunk_size)
+
+    # the per-epoch fork is cs work that only parallel mode pays, so it is charged to the first query of the epoch
+    start_time = time.perf_counter()
+    p = proof_pool(cs_tree, n_workers)
+    proof_chunks = p.map(proof_worker, [(proof_mode, chunk) for chunk in rq_chunks])
+
+    if proof_mode == "packed":
+        vo_buf = cs_tree.encode_vo([buf for chunk in proof_chunks for buf in chunk])
+    cs_gen_proof = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    if proof_mode == "packed":
+        cur_proofs = cs_tree.decode_vo(vo_buf)
+        proof_chunks = split_chunks([bytes(buf) for buf in cur_proofs], chunk_size)
+    else:
+        cur_proofs = [proof for chunk in proof_chunks for proof in chunk]
+
+    is_valid = all(p.map(verify_worker, [(proof_mode, elements, chunk)
+                                         for elements, chunk in zip(rq_chunks, proof_chunks)]))
+    rp_veri_proof = time.perf_counter() - start_time
+
+    return is_valid, cs_gen_proof, rp_veri_proof, cur_proofs
+
+
+def verify_integrity(vo, signature, ts, bls_pk, proof_mode="single", n_workers=0):
     cs_gen_proof = 0
     rp_veri_proof = 0
     proofs = []
@@ -144,24 +328,64 @@ def verify_integrity(vo, signature, ts, bls_pk):
     for rq, cs_tree in vo:
         cur_proofs = []
 
-        for e in rq:
+        if n_workers and proof_mode != "multi" and len(rq) >= 4 * n_workers:
+            is_valid, t_gen, t_veri, cur_proofs = parallel_proofs(rq, cs_tree, proof_mode, n_workers)
+
+            cs_gen_proof += t_gen
+            rp_veri_proof += t_veri
+
+            if not is_valid:
+                return False, cs_gen_proof, rp_veri_proof, proofs
+        elif proof_mode == "multi":
+            if rq:
+                start_time = time.perf_counter()
+                proof = cs_tree.get_multiproof(rq)
+                cs_gen_proof += time.perf_counter() - start_time
+
+                cur_proofs.append(proof)
+
+                Start_time = time.perf_counter()
+                recomputed_root = cs_tree.compute_aa_multiroot(proof)
+
+                if recomputed_root != proof["merkle_root"]:
+                    return False, cs_gen_proof, rp_veri_proof, proofs
+                rp_veri_proof += time.perf_counter() - Start_time
+        elif proof_mode == "packed":
+            rq_list = list(rq)
+
             start_time = time.perf_counter()
-            proof = cs_tree.get_proof(e)
+            vo_buf = cs_tree.encode_vo([cs_tree.get_packed_proof(e) for e in rq_list])
             cs_gen_proof += time.perf_counter() - start_time
 
-            cur_proofs.append(proof)
-
             Start_time = time.perf_counter()
-            recomputed_root = cs_tree.compute_aa_root(proof)
+            cur_proofs = cs_tree.decode_vo(vo_buf)
 
-            if recomputed_root != proof["merkle_root"]:
-                return False, cs_gen_proof, rp_veri_proof, proofs
+            for e, buf in zip(rq_list, cur_proofs):
+                if not cs_tree.verify_packed(e, buf):
+                    return False, cs_gen_proof, rp_veri_proof, proofs
             rp_veri_proof += time.perf_counter() - Start_time
+        else:
+            for e in rq:
+                start_time = time.perf_counter()
+                proof = cs_tree.get_proof(e)
+                cs_gen_proof += time.perf_counter() - start_time
+
+                cur_proofs.append(proof)
+
+                Start_time = time.perf_counter()
+                recomputed_root = cs_tree.compute_aa_root(proof)
+
+                if recomputed_root != proof["merkle_root"]:
+                    return False, cs_gen_proof, rp_veri_proof, proofs
+                rp_veri_proof += time.perf_counter() - Start_time
 
         proofs.append(cur_proofs)
 
         if rq:
-            root = int(cur_proofs[0]["merkle_root"], 16)
+            if proof_mode == "packed":
+                root = cs_tree.packed_root(cur_proofs[0])
+            else:
+                root = int(cur_proofs[0]["merkle_root"], 16)
 
             start_Time = time.perf_counter()
             is_valid = HomomorphicBLS.verify(bls_pk, ts, root, signature)
@@ -173,10 +397,17 @@ def verify_integrity(vo, signature, ts, bls_pk):
     return True, cs_gen_proof, rp_veri_proof, proofs
 
 
-def blinding(items, N, E):
+def blinding(items, N, E, blind_pool=None):
     blinded = []
     r_invs = []
 
+    if blind_pool is not None:
+        for e, (r_e, r_inv) in zip(items, blind_pool.draw(len(items))):
+            blinded.append((EllipticCurveUtils.data_2_scalar(e) * r_e) % N)
+            r_invs.append(r_inv)
+
+        return blinded, r_invs
+
     for e in items:
         while True:
             r = secrets.randbelow(N - 2) + 2
@@ -192,66 +423,87 @@ def blinding(items, N, E):
     return blinded, r_invs
 
 
-def TSFVP_PSICVP(q, s, rq, cf, rsa_keys):
-    N, E, D = rsa_keys['N'], rsa_keys['E'], rsa_keys['D']
-
-    aug_rq = list(s) + list(rq)
+def sign_worker(args):
+    blinded, rsa_keys = args
 
     start_time = time.perf_counter()
-    blinded, r_invs = blinding(aug_rq, N, E)
-    rp_blind_time = time.perf_counter() - start_time
+    resps = [rsa_sign(b, rsa_keys) for b in blinded]
 
-    start_time = time.perf_counter()
-    resps = [pow(b, D, N) for b in blinded]
-    cs_sign_time = time.perf_counter() - start_time
+    return resps, time.perf_counter() - start_time
 
-    start_time = time.perf_counter()
 
-    unblinded = []
-    for resp, r_inv in zip(resps, r_invs):
-        unblinded.append((resp * r_inv) % N)
+def psi_pipeline(items, rsa_keys, timings, blind_pool=None, pool=None, chunk_size=1024):
+    N, E = rsa_keys['N'], rsa_keys['E']
 
-    verified = True
+    depth = 2 * cpu_count() if pool is not None and len(items) > chunk_size else 0
+    in_flight = deque()
 
-    for val in unblinded:
-        if not cf.seek(val):
-            verified = False
-            break
+    def unblind(task, r_invs):
+        resps, t_sign = task.get() if depth else task
+        timings["sign"] += t_sign
 
-    if verified:
-        cf.delete(unblinded)
+        start_time = time.perf_counter()
+        unblinded = [(resp * r_inv) % N for resp, r_inv in zip(resps, r_invs)]
+        words = CuckooFilter.digest_many(unblinded)
+        timings["verify"] += time.perf_counter() - start_time
 
-    rp_verify_time = time.perf_counter() - start_time
+        return words
 
-    if not verified:
-        return False, rp_blind_time, cs_sign_time, rp_verify_time
+    for i in range(0, len(items), chunk_size):
+        start_time = time.perf_counter()
+        blinded, r_invs = blinding(items[i:i + chunk_size], N, E, blind_pool)
+        timings["blind"] += time.perf_counter() - start_time
 
-    # ------------------------------------------------------------
+        if depth:
+            in_flight.append((pool.apply_async(sign_worker, ((blinded, rsa_keys),)), r_invs))
+            if len(in_flight) < depth:
+                continue
+        else:
+            in_flight.append((sign_worker((blinded, rsa_keys)), r_invs))
 
-    start_time = time.perf_counter()
-    blinded, r_invs = blinding(list(q), N, E)
-    rp_blind_time += (time.perf_counter() - start_time)
+        yield unblind(*in_flight.popleft())
 
-    start_time = time.perf_counter()
-    resps = [pow(b, D, N) for b in blinded]
-    cs_sign_time += (time.perf_counter() - start_time)
+    while in_flight:
+        yield unblind(*in_flight.popleft())
+
+
+def TSFVP_PSICVP(q, s, rq, cf, rsa_keys, blind_pool=None, pool=None, chunk_size=1024):
+    timings = {"blind": 0, "sign": 0, "verify": 0}
+
+    aug_rq = list(s) + list(rq)
+
+    verified = True
+    verified_words = []
+
+    for words in psi_pipeline(aug_rq, rsa_keys, timings, blind_pool, pool, chunk_size):
+        start_time = time.perf_counter()
+        verified = bool(cf.contains_words(words).all())
+        timings["verify"] += time.perf_counter() - start_time
+
+        if not verified:
+            return False, timings["blind"], timings["sign"], timings["verify"]
+
+        verified_words.append(words)
 
     start_time = time.perf_counter()
-    unblinded = []
-    for resp, r_inv in zip(resps, r_invs):
-        unblinded.append((resp * r_inv) % N)
+    if verified_words:
+        cf.delete_words(np.concatenate(verified_words))
+    timings["verify"] += time.perf_counter() - start_time
 
-    fp_count = 0
-    for val in unblinded:
-        if cf.seek(val):
-            fp_count += 1
+    # ------------------------------------------------------------
+
+    q_list = list(q)
 
-    fp_rate = (2 * cf.bucket_size) / (2 ** cf.fp_size)
-    fp_threshold = math.ceil(len(unblinded) * fp_rate * 3.0) + 3
+    fp_count = 0
+    fp_threshold = math.ceil(len(q_list) * cf.fp_rate * 3.0) + 3
 
-    if fp_count > fp_threshold:
-        verified = False
+    for words in psi_pipeline(q_list, rsa_keys, timings, blind_pool, pool, chunk_size):
+        start_time = time.perf_counter()
+        fp_count += int(cf.contains_words(words).sum())
+        timings["verify"] += time.perf_counter() - start_time
 
-    rp_verify_time += (time.perf_counter() - start_time)
+        if fp_count > fp_threshold:
+            verified = False
+            break
 
-    return verified, rp_blind_time, cs_sign_time, rp_verify_time
+    return verified, timings["blind"], timings["sign"], timings["verify"]
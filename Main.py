@@ -1,8 +1,7 @@
 import argparse
 import sys
-from Graph_Ops import gen_update
+from Deploy import deploy
 from Logic_Check import *
-from multiprocessing.pool import ThreadPool
 
 
 POOL = None
@@ -16,17 +15,54 @@ def main():
     parser.add_argument('--batch_size', type=int, default=Config.BATCH_SIZE)
     parser.add_argument('--ts_size', type=int, default=Config.TIMESTAMP_SIZE)
     parser.add_argument('--query', type=str, default=Config.SUB_IDX)
+    parser.add_argument('--query_file', type=str, default=Config.QUERY_FILE,
+                        help="File of query patterns (one per line) answered together against each epoch")
     parser.add_argument('--rounds', type=int, default=Config.N_ROUNDS)
     parser.add_argument('--interval', type=int, default=Config.QUERY_INTERVAL)
+    parser.add_argument('--compact', type=int, default=Config.COMPACT_THRESHOLD, help="Fold AA-MHT history beyond this many subtrees")
+    parser.add_argument('--proof', type=str, default=Config.PROOF_MODE, choices=["single", "multi", "packed"],
+                        help="Integrity VO format: per-element, batched multiproof, or packed binary")
+    parser.add_argument('--proof_workers', type=int, default=Config.PROOF_WORKERS,
+                        help="Worker processes for proof generation/verification (0 for serial)")
+    parser.add_argument('--blind_pool', type=int, default=Config.BLIND_POOL_SIZE, help="Precomputed RSA blinding pairs (0 to blind inline)")
+    parser.add_argument('--psi_chunk', type=int, default=Config.PSI_CHUNK, help="Elements per PSI pipeline chunk")
+    parser.add_argument('--cf_shards', type=int, default=Config.CF_SHARDS, help="Shared-memory cuckoo filter shards (0 for a single filter)")
+    parser.add_argument('--cf_load', type=float, default=Config.CF_LOAD, help="Target cuckoo filter load factor")
+    parser.add_argument('--cf_fp_bits', type=int, default=Config.CF_FP_BITS, choices=[8, 12, 16, 32],
+                        help="Cuckoo filter fingerprint width")
+    parser.add_argument('--audit', action='store_true', default=Config.AUDIT, help="Batch-verify every epoch signature at the end")
+    parser.add_argument('--deploy', type=str, default=Config.DEPLOY, choices=["unix", "tcp"],
+                        help="Run DO, CS and RPs as separate processes over a Unix-domain or localhost TCP socket")
+    parser.add_argument('--clients', type=int, default=Config.N_CLIENTS, help="Concurrent RP processes in deploy mode")
+    parser.add_argument('--client_queries', type=int, default=Config.CLIENT_QUERIES, help="Queries issued by each RP")
+    parser.add_argument('--cs_workers', type=int, default=Config.CS_WORKERS, help="CS worker processes for RSA signing (0 for inline)")
     args = parser.parse_args()
 
+    # the shards live in shared memory and are driven by this process's pool, neither survives the deploy forks
+    if args.cf_shards and args.deploy:
+        parser.error("--cf_shards cannot be combined with --deploy")
+
     Config.GDB_IDX = args.dataset
     Config.INITIAL_RATIO = args.init_ratio
     Config.BATCH_SIZE = args.batch_size
     Config.TIMESTAMP_SIZE = args.ts_size
     Config.SUB_IDX = args.query
+    Config.QUERY_FILE = args.query_file
     Config.N_ROUNDS = args.rounds
     Config.QUERY_INTERVAL = args.interval
+    Config.COMPACT_THRESHOLD = args.compact
+    Config.PROOF_MODE = args.proof
+    Config.PROOF_WORKERS = args.proof_workers
+    Config.BLIND_POOL_SIZE = args.blind_pool
+    Config.PSI_CHUNK = args.psi_chunk
+    Config.CF_SHARDS = args.cf_shards
+    Config.CF_LOAD = args.cf_load
+    Config.CF_FP_BITS = args.cf_fp_bits
+    Config.AUDIT = args.audit
+    Config.DEPLOY = args.deploy
+    Config.N_CLIENTS = args.clients
+    Config.CLIENT_QUERIES = args.client_queries
+    Config.CS_WORKERS = args.cs_workers
 
     global POOL
     POOL = Pool(processes=96)
@@ -39,34 +75,59 @@ def main():
     g_nodes, g_edges, update_batches = Load_Graph(Config.GDB_IDX, Config.INITIAL_RATIO, Config.BATCH_SIZE, args.scale)
     print(f"[INFO] Graph Ready: |V|={len(g_nodes)}, |E|={len(g_edges)}")
 
-    q_nodes, q_edges = get_subgraph(g_edges, Config.SUB_IDX)
+    if Config.QUERY_FILE:
+        subgraphs = get_subgraphs(g_edges, Config.QUERY_FILE)
+    else:
+        subgraphs = [get_subgraph(g_edges, Config.SUB_IDX)]
+
+    # overlapping queries share one VO and one PSI pass over their union
+    q_nodes = set().union(*(nodes for nodes, _ in subgraphs))
+    q_edges = set().union(*(edges for _, edges in subgraphs))
     print(f"[INFO] Subgraph Ready: |V_q|={len(q_nodes)}, |E_q|={len(q_edges)}")
 
     q = q_nodes | q_edges
     rq = q.copy()
 
+    n_queries = len(subgraphs)
+    if n_queries > 1:
+        print(f"[INFO] Query Batch: |Q|={n_queries}, "
+              f"|rq|={sum(len(nodes) + len(edges) for nodes, edges in subgraphs)} ({len(rq)} distinct)")
+
     init_ts, init_sig, cs_tree, (s_nodes, s_edges) = init_outsourcing(g_nodes, g_edges, bls_sk, Config.TIMESTAMP_SIZE)
 
     s = s_nodes | s_edges
 
     cf = get_cf(g_nodes, g_edges, s_nodes, s_edges,
-                rsa_keys, Config.GDB_IDX, Config.INITIAL_RATIO, args.scale)
+                rsa_keys, Config.GDB_IDX, Config.INITIAL_RATIO, args.scale, pool=POOL, update_batches=update_batches)
+
+    if Config.DEPLOY:
+        if not deploy((bls_sk, bls_pk), rsa_keys, g_nodes, g_edges, update_batches, q_nodes, q_edges,
+                      cs_tree, cf, init_sig, init_ts):
+            sys.exit(1)
+
+        print()
+        return
+
+    blind_pool = None
+    if Config.BLIND_POOL_SIZE:
+        blind_pool = BlindingPool(rsa_keys['N'], rsa_keys['E'], size=Config.BLIND_POOL_SIZE, background=False)
 
     # ------------------------------------------------------------
     # ------------------------------------------------------------
 
-    Is_Integ, t_gen_proof, t_veri_proof, _ = verify_integrity([(rq, cs_tree)], init_sig, init_ts, bls_pk)
+    Is_Integ, t_gen_proof, t_veri_proof, _ = verify_integrity([(rq, cs_tree)], init_sig, init_ts, bls_pk,
+                                                              proof_mode=Config.PROOF_MODE,
+                                                              n_workers=Config.PROOF_WORKERS)
 
-    Is_FreCo, t_blnd, t_sign, t_verify = TSFVP_PSICVP(q, s, rq, cf, rsa_keys)
+    Is_FreCo, t_blnd, t_sign, t_verify = TSFVP_PSICVP(q, s, rq, cf, rsa_keys, blind_pool, POOL, Config.PSI_CHUNK)
 
     if not Is_Integ or not Is_FreCo:
         sys.exit(1)
 
-    N, D = rsa_keys['N'], rsa_keys['D']
+    cf.insert_many([rsa_sign(EllipticCurveUtils.data_2_scalar(e), rsa_keys) for e in list(s) + list(rq)])
 
-    for e in list(s) + list(rq):
-        enc_val = pow(EllipticCurveUtils.data_2_scalar(e), D, N)
-        cf.insert(enc_val)
+    if blind_pool is not None:
+        blind_pool.refill()
 
     # ------------------------------------------------------------
     # ------------------------------------------------------------
@@ -79,51 +140,28 @@ def main():
     total_do = 0
     total_cs = 0
 
-    for i in range(Config.N_ROUNDS):
-        round_idx = i + 1
+    epochs = [(cur_ts, int(cs_tree.merkle_root, 16), cur_sig)]
 
-        update_type = "Addition"
-        if update_batches and i < len(update_batches):
-            batch_edges = update_batches[i]
-            update_ts = datetime.now().strftime(f"%Y%m%d%H%M%S{round_idx}")
-        else:
-            if round_idx % 4 == 0:
-                update_type = "Deletion"
-
-            _, batch_edges, update_ts = gen_update(g_nodes, g_edges, Config.BATCH_SIZE, update_type,
-                                                   locked_nodes=q_nodes, locked_edges=q_edges)
+    stream_store = get_stream_store(rsa_keys, Config.GDB_IDX, Config.INITIAL_RATIO, Config.BATCH_SIZE)
+    stream_offset = 0
 
-        batch_edges = {tuple(sorted(e)) for e in batch_edges}
-
-        update_edges = batch_edges
+    for i in range(Config.N_ROUNDS):
+        round_idx = i + 1
 
-        if update_type == "Addition":
-            update_nodes = {node for edge in batch_edges for node in edge}
-        else:
-            edge_pool = g_edges - update_edges
-            active_nodes = {node for edge in edge_pool for node in edge}
-            updated_nodes = {node for edge in update_edges for node in edge}
-            update_nodes = updated_nodes - active_nodes
+        update_type, update_nodes, update_edges, update_ts = next_update(g_nodes, g_edges, update_batches, round_idx,
+                                                                         q_nodes, q_edges)
 
         s_nodes, s_edges = mapping_function_psi(update_ts, Config.TIMESTAMP_SIZE)
         s = s_nodes | s_edges
 
-        update_items = sorted(list(update_nodes) + list(update_edges), key=lambda x: str(x))
-        s_items = sorted(list(s), key=lambda x: str(x))
+        update_items = sorted(list(update_nodes) + list(update_edges), key=encode_element)
+        s_items = sorted(list(s), key=encode_element)
 
         # ------------------------------------------------------------
         # ------------------------------------------------------------
 
         timer.tick()
-        update_root = int(MHT(update_items).merkle_root, 16) % curve_order
-        s_root = int(MHT(s_items).merkle_root, 16) % curve_order
-
-        if update_type == "Addition":
-            delta_root = (update_root + s_root) % curve_order
-        else:
-            delta_root = (-update_root + s_root) % curve_order
-
-        delta_sigma = HomomorphicBLS.sign_update(bls_sk, cur_ts, update_ts, delta_root)
+        delta_sigma = sign_epoch(bls_sk, cur_ts, update_ts, update_type, update_items, s_items)
         t_do_update = timer.tock()
 
         # ------------------------------------------------------------
@@ -133,10 +171,12 @@ def main():
         cur_sig = HomomorphicBLS.aggregate(cur_sig, delta_sigma)
 
         if update_type == "Addition":
+            cf_items = fresh_items(update_items, g_nodes, g_edges)
             cs_tree.addition(update_items)
             g_nodes |= update_nodes
             g_edges |= update_edges
         else:
+            cf_items = update_items
             cs_tree.deletion(update_items)
             g_nodes -= update_nodes
             g_edges -= update_edges
@@ -146,32 +186,31 @@ def main():
         # ------------------------------------------------------------
         # ------------------------------------------------------------
 
-        raw_update = [EllipticCurveUtils.data_2_scalar(e) for e in update_items]
+        raw_update = [EllipticCurveUtils.data_2_scalar(e) for e in cf_items]
         raw_s = [EllipticCurveUtils.data_2_scalar(e) for e in s_items]
 
-        args_update = [(x, D, N) for x in raw_update]
-        args_s = [(x, D, N) for x in raw_s]
+        args_s = [(x, rsa_keys) for x in raw_s]
 
-        enc_update = POOL.map(rsa_worker, args_update, chunksize=500)
+        if update_batches and round_idx <= len(update_batches):
+            enc_update = sign_stream_batch(stream_store, stream_offset, raw_update, rsa_keys, POOL)
+            stream_offset += len(raw_update)
+        else:
+            enc_update = POOL.map(rsa_worker, [(x, rsa_keys) for x in raw_update], chunksize=500)
 
         if len(args_s) > 500:
             enc_s = POOL.map(rsa_worker, args_s, chunksize=500)
         else:
-            enc_s = [pow(x, D, N) for x in raw_s]
+            enc_s = [rsa_sign(x, rsa_keys) for x in raw_s]
 
         to_insert = []
         if update_type == "Addition":
             to_insert.extend(enc_update)
         to_insert.extend(enc_s)
 
-        with ThreadPool(processes=32) as tp:
-            vals = tp.map(cf.ins, to_insert)
-
-            for val in vals:
-                cf.ert(val)
+        cf.insert_many(to_insert)
 
         if update_type != "Addition" and enc_update:
-            cf.delete(enc_update)
+            cf.delete_many(enc_update)
         t_cs_update = timer.tock()
 
         # ------------------------------------------------------------
@@ -182,29 +221,62 @@ def main():
         total_do += t_do_update
         total_cs += t_cs_update
 
+        if Config.AUDIT:
+            epochs.append((cur_ts, int(cs_tree.merkle_root, 16), cur_sig))
+
         if round_idx % Config.QUERY_INTERVAL == 0:
             q = q_nodes | q_edges
             rq = q.copy()
 
-            Is_Integ, t_gen_proof, t_veri_proof, _ = verify_integrity([(rq, cs_tree)], cur_sig, cur_ts, bls_pk)
+            Is_Integ, t_gen_proof, t_veri_proof, _ = verify_integrity([(rq, cs_tree)], cur_sig, cur_ts, bls_pk,
+                                                                      proof_mode=Config.PROOF_MODE,
+                                                                      n_workers=Config.PROOF_WORKERS)
 
-            Is_FreCo, t_blnd, t_sign, t_verify = TSFVP_PSICVP(q, s, rq, cf, rsa_keys)
+            Is_FreCo, t_blnd, t_sign, t_verify = TSFVP_PSICVP(q, s, rq, cf, rsa_keys, blind_pool,
+                                                              POOL, Config.PSI_CHUNK)
 
             if not Is_Integ or not Is_FreCo:
                 sys.exit(1)
 
-            for e in list(s) + list(rq):
-                enc_val = pow(EllipticCurveUtils.data_2_scalar(e), D, N)
-                cf.insert(enc_val)
+            cf.insert_many([rsa_sign(EllipticCurveUtils.data_2_scalar(e), rsa_keys) for e in list(s) + list(rq)])
+
+            if blind_pool is not None:
+                blind_pool.refill()
+
+            t_cs_query = (t_gen_proof + t_sign) * 1000
+            t_rp_query = (t_veri_proof + t_blnd + t_verify) * 1000
 
             tqdm.write(f"[RESULT] [ROUND {round_idx}] "
                        f"DO: {t_do_update:.0f}ms "
-                       f"CS: {t_cs_update + (t_gen_proof + t_sign) * 1000:.0f}ms "
-                       f"RP: {(t_veri_proof + t_blnd + t_verify) * 1000:.0f}ms")
+                       f"CS: {t_cs_update + t_cs_query:.0f}ms "
+                       f"RP: {t_rp_query:.0f}ms")
+
+            if n_queries > 1:
+                tqdm.write(f"[RESULT] [BATCH {round_idx}] |Q|={n_queries} "
+                           f"CS: {t_cs_query / n_queries:.1f}ms/query "
+                           f"RP: {t_rp_query / n_queries:.1f}ms/query "
+                           f"throughput: {n_queries * 1000 / (t_cs_query + t_rp_query):.1f} queries/s")
 
             if Config.QUERY_INTERVAL == Config.N_ROUNDS:
                 print(f"[RESULT] [TOTAL] DO: {total_do:.0f}ms CS: {total_cs:.0f}ms")
 
+    cf_stats = cf.stats()
+    print(f"[INFO] CF: |S|={cf_stats['n_items']} blocks={cf_stats['n_blocks']} "
+          f"load={cf_stats['load_factor']:.2f} kicks={cf_stats['n_kicks']} failed={cf_stats['n_failed']} "
+          f"mem={cf_stats['n_bytes'] / 1024:.0f}KB")
+
+    if Config.AUDIT:
+        timer.tick()
+        Is_Audit, bad_idxs = HomomorphicBLS.batch_verify(bls_pk, epochs)
+        t_audit = timer.tock()
+
+        print(f"[RESULT] [AUDIT] |epochs|={len(epochs)} "
+              f"RP: {t_audit:.0f}ms ({t_audit / len(epochs):.1f}ms/epoch)")
+
+        if not Is_Audit:
+            print(f"[ERROR] Invalid epoch signatures: {[epochs[idx][0] for idx in bad_idxs]}")
+            sys.exit(1)
+
     print()
 
 
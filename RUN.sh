@@ -234,4 +234,56 @@ case $TARGET in
             echo "" | tee -a $LOG_FILE
         done
         ;;
+    "batch")
+        GDB_NAMES=("Email" "DBLP" "Youtube")
+        QUERY_FILE="queries.txt"
+        printf "%s\n" "${QUERIES[@]}" > $QUERY_FILE
+
+        for db in 0 1 2; do
+            CUR_DB=${GDB_NAMES[$db]}
+            echo "==============================================================================" | tee -a $LOG_FILE
+            echo "[META] EXP=batch DATASET_IDX=$db DATASET_NAME=$CUR_DB QUERIES=${#QUERIES[@]} BATCH=$DEFAULT_BATCH TS=$DEFAULT_TS" | tee -a $LOG_FILE
+            echo ">> [START] Query Batch: DB=$CUR_DB ($db), Queries=${QUERIES[*]}" | tee -a $LOG_FILE
+
+            python Main.py \
+            --dataset $db \
+            --init_ratio 1.0 \
+            --batch_size $DEFAULT_BATCH \
+            --ts_size $DEFAULT_TS \
+            --query_file $QUERY_FILE \
+            --rounds $DEFAULT_ROUNDS \
+            --interval $DEFAULT_INTERVAL >> $LOG_FILE 2>&1
+
+            echo ">> [END] Finished $CUR_DB - Batch" | tee -a $LOG_FILE
+            echo "" | tee -a $LOG_FILE
+        done
+        ;;
+
+    "deploy")
+        CUR_DB="Email"
+        CLIENTS=(1 2 4 8 16)
+
+        for c in "${CLIENTS[@]}"; do
+            for t in "unix" "tcp"; do
+                echo "==============================================================================" | tee -a $LOG_FILE
+                echo "[META] EXP=deploy DATASET_NAME=$CUR_DB TRANSPORT=$t CLIENTS=$c QUERY=5n6e BATCH=$DEFAULT_BATCH TS=$DEFAULT_TS" | tee -a $LOG_FILE
+                echo ">> [START] Deployment: Transport=$t, Clients=$c" | tee -a $LOG_FILE
+
+                python Main.py \
+                --dataset 0 \
+                --init_ratio 1.0 \
+                --batch_size $DEFAULT_BATCH \
+                --ts_size $DEFAULT_TS \
+                --query 5n6e \
+                --rounds $DEFAULT_ROUNDS \
+                --proof packed \
+                --deploy $t \
+                --clients $c \
+                --client_queries 20 >> $LOG_FILE 2>&1
+
+                echo ">> [END] Finished Transport=$t - Clients=$c" | tee -a $LOG_FILE
+                echo "" | tee -a $LOG_FILE
+            done
+        done
+        ;;
 esac
\ No newline at end of file